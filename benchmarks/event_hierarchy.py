@@ -0,0 +1,101 @@
+# Compares parse throughput and retained memory of the current event
+# classes against the ones from another revision, on a synthetic file.
+# The baseline defaults to the revision before events.py gained slots.
+#
+#   python benchmarks/event_hierarchy.py --tracks 16 --events 50000
+#   python benchmarks/event_hierarchy.py --baseline HEAD~1
+
+import subprocess
+import tracemalloc
+import argparse
+import tempfile
+import types
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import midistuff.midi_parser.events as events
+import midistuff.midi_parser.parser as parser
+import synthetic
+
+
+def git(*args):
+    return subprocess.check_output(("git",) + args, cwd=ROOT)
+
+
+def default_baseline():
+    # Parent of the oldest commit adding __slots__ to the event classes
+    commits = git("log", "--format=%H", "--reverse", "-S__slots__", "--",
+                  "midistuff/midi_parser/events.py").split()
+    if not commits:
+        sys.exit("No commit adds __slots__ to events.py, pass --baseline")
+
+    return git("rev-parse", commits[0].decode() + "~1").decode().strip()
+
+
+def load_events_module(rev):
+    source = git("show", rev + ":midistuff/midi_parser/events.py")
+    module = types.ModuleType("events_" + rev)
+    exec(compile(source, module.__name__, "exec"), module.__dict__)
+
+    return module
+
+
+def measure(events_module, file_name, repeat):
+    parser.events = events_module
+
+    try:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            midi_file = parser.load(file_name)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        event_count = sum(len(chunk.events) for chunk in midi_file.chunks)
+        del midi_file
+
+        tracemalloc.start()
+        midi_file = parser.load(file_name)
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        parser.events = events
+
+    return event_count, event_count / best, retained
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--tracks", type=int, default=16)
+    arg_parser.add_argument("--events", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--baseline", default=None,
+                            help="revision to compare against, defaults to the one before slots")
+    args = arg_parser.parse_args()
+
+    baseline = args.baseline
+    if baseline is None:
+        baseline = default_baseline()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "synthetic.mid")
+        with open(file_name, "wb") as file:
+            file.write(synthetic.generate(args.tracks, args.events))
+
+        results = [
+            ("baseline " + baseline[:8],
+             measure(load_events_module(baseline), file_name, args.repeat)),
+            ("current", measure(events, file_name, args.repeat))
+        ]
+
+    for name, (event_count, rate, retained) in results:
+        print("{:<18} {:>9} events {:>12,.0f} events/s {:>8.1f} MB retained {:>6.0f} B/event".format(
+            name, event_count, rate, retained / 2**20, retained / event_count))
+
+
+if __name__ == "__main__":
+    main()
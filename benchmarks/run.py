@@ -0,0 +1,143 @@
+# Parser benchmark on deterministic synthetic files, no samples needed.
+#
+#   python benchmarks/run.py
+#   python benchmarks/run.py --tracks 64 --events 5000 --meta-density 0.1 --json > results.json
+#
+# Every timing is the best of --repeat runs. Peak memory is measured with
+# tracemalloc on a separate run, so it does not slow the timed runs.
+
+import subprocess
+import tracemalloc
+import argparse
+import tempfile
+import time
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.playback as playback
+import synthetic
+
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def decode_tracks(file_name):
+    midi_file = parser.load(file_name, lazy=True)
+    bodies = [chunk._read_source() for chunk in midi_file.chunks]
+
+    def run():
+        for chunk, body in zip(midi_file.chunks, bodies):
+            chunk.events = []
+            chunk._load_data(body)
+
+    return run
+
+
+def construct(file_name):
+    return lambda: parser.load(file_name)
+
+
+def iterate(file_name):
+    midi_file = parser.load(file_name)
+    return lambda: sum(1 for event in midi_file.iter_events())
+
+
+def schedule(file_name):
+    midi_file = parser.load(file_name)
+    return lambda: sum(1 for group in playback.iter_groups(midi_file))
+
+
+BENCHMARKS = [
+    ("MTrk._load_data", decode_tracks),
+    ("MidiFile()", construct),
+    ("iter_events", iterate),
+    ("iter_groups", schedule)
+]
+
+
+def measure(setup, file_name, repeat):
+    run = setup(file_name)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--tracks", type=int, default=16)
+    arg_parser.add_argument("--events", type=int, default=20000, help="channel events per track")
+    arg_parser.add_argument("--density", type=float, default=4.0, help="events per beat")
+    arg_parser.add_argument("--no-running-status", action="store_true")
+    arg_parser.add_argument("--meta-density", type=float, default=0.0)
+    arg_parser.add_argument("--sysex-density", type=float, default=0.0)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+
+    data = synthetic.generate(
+        args.tracks, args.events, args.seed, density=args.density,
+        running_status=not args.no_running_status,
+        meta_density=args.meta_density, sysex_density=args.sysex_density)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "synthetic.mid")
+        with open(file_name, "wb") as file:
+            file.write(data)
+
+        event_count = sum(len(chunk.events) for chunk in parser.load(file_name).chunks)
+
+        results = []
+        for name, setup in BENCHMARKS:
+            seconds, peak = measure(setup, file_name, args.repeat)
+            results.append({
+                "name": name,
+                "seconds": seconds,
+                "events_per_second": event_count / seconds,
+                "mb_per_second": len(data) / seconds / 2**20,
+                "peak_memory": peak
+            })
+
+    if args.json:
+        json.dump({
+            "revision": revision(),
+            "python": sys.version.split()[0],
+            "options": vars(args),
+            "file_size": len(data),
+            "event_count": event_count,
+            "results": results
+        }, sys.stdout, indent=2)
+        print()
+        return
+
+    print("{} ({} events, {:.1f} MB)".format(revision(), event_count, len(data) / 2**20))
+    for result in results:
+        print("{:<18} {:>9.4f}s {:>12,.0f} events/s {:>8.2f} MB/s {:>8.1f} MB peak".format(
+            result["name"], result["seconds"], result["events_per_second"],
+            result["mb_per_second"], result["peak_memory"] / 2**20))
+
+
+if __name__ == "__main__":
+    main()
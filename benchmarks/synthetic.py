@@ -0,0 +1,78 @@
+import random
+
+
+TIME_DIVISION = 480
+
+
+def var_len(value):
+    data = [value & 0x7F]
+    value >>= 7
+
+    while value:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    return bytes(reversed(data))
+
+
+def _meta(meta_type, payload):
+    return b'\xff' + bytes((meta_type,)) + var_len(len(payload)) + payload
+
+
+def generate_track(event_count, seed=0, name="Track", density=4.0,
+                   running_status=True, meta_density=0.0, sysex_density=0.0):
+    # density is the average number of events per beat, meta_density and
+    # sysex_density the chance of a text meta or sysex event between
+    # channel events
+    rand = random.Random(seed)
+    max_delta = int(2 * TIME_DIVISION / density)
+
+    body = bytearray()
+    body += b'\x00' + _meta(0x03, name.encode("ascii"))
+    body += b'\x00' + _meta(0x51, b'\x07\xa1\x20')
+
+    status = None
+    for index in range(event_count):
+        if meta_density and rand.random() < meta_density:
+            meta_type = rand.choice([0x01, 0x05, 0x06])
+            text = "event {}".format(index).encode("ascii")
+            body += b'\x00' + _meta(meta_type, text)
+
+            # Meta events cancel running status
+            status = None
+
+        if sysex_density and rand.random() < sysex_density:
+            payload = bytes(rand.randrange(128) for _ in range(rand.randrange(4, 32)))
+            body += b'\x00\xf0' + var_len(len(payload) + 1) + payload + b'\xf7'
+            status = None
+
+        event_type = rand.choice([9, 9, 9, 8, 11, 12, 14])
+        channel = rand.randrange(16)
+
+        body += var_len(rand.randrange(max_delta + 1) if rand.random() < 0.5 else 0)
+
+        if (event_type << 4 | channel) != status or not running_status:
+            status = event_type << 4 | channel
+            body.append(status)
+
+        if event_type == 12:
+            body.append(rand.randrange(128))
+        else:
+            body += bytes([rand.randrange(128), rand.randrange(1, 128)])
+
+    body += b'\x00' + _meta(0x2F, b'')
+
+    return b'MTrk' + len(body).to_bytes(4, "big") + bytes(body)
+
+
+def generate(track_count=16, events_per_track=10000, seed=0, **options):
+    data = bytearray(b'MThd' + (6).to_bytes(4, "big"))
+    data += (1).to_bytes(2, "big")
+    data += track_count.to_bytes(2, "big")
+    data += TIME_DIVISION.to_bytes(2, "big")
+
+    for track in range(track_count):
+        data += generate_track(
+            events_per_track, seed + track, "Track {}".format(track), **options)
+
+    return bytes(data)
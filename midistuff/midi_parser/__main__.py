@@ -0,0 +1,102 @@
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.events as events
+import concurrent.futures
+import argparse
+import time
+import json
+import glob
+import sys
+import os
+
+
+MIDI_EXTENSIONS = (".mid", ".midi", ".smf")
+
+
+def find_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, directories, file_names in os.walk(path):
+                directories.sort()
+                for file_name in sorted(file_names):
+                    if file_name.lower().endswith(MIDI_EXTENSIONS):
+                        yield os.path.join(root, file_name)
+        elif os.path.exists(path):
+            yield path
+        else:
+            yield from sorted(glob.glob(path, recursive=True))
+
+
+def _track_ticks(chunk):
+    return chunk.events[-1].abs_delta_time if chunk.events else 0
+
+
+def summarise(file_name):
+    summary = {"file": file_name, "size": None, "error": None}
+    start = time.perf_counter()
+
+    # Any failure is reported for this file alone, never for the run
+    try:
+        summary["size"] = os.path.getsize(file_name)
+        midi_file = parser.load(file_name)
+        # Last tick on the file's timeline, format 2 sequences end to end
+        ticks = max((offset + _track_ticks(chunk) for offset, chunk in zip(
+            midi_file.sequence_offsets(), midi_file.chunks)), default=0)
+
+        summary.update({
+            "format": midi_file.header.format_type,
+            "tracks": len(midi_file.chunks),
+            "time_division": midi_file.header.time_division,
+            "events": sum(len(chunk.events) for chunk in midi_file.chunks),
+            "ticks": ticks,
+            "duration": midi_file.tick_to_seconds(ticks),
+            "tempo_changes": sum(
+                1 for chunk in midi_file.chunks for event in chunk.events
+                if type(event) is events.SetTempoEvent)
+        })
+    except Exception as error:
+        summary["error"] = "{}: {}".format(type(error).__name__, error)
+
+    summary["parse_seconds"] = time.perf_counter() - start
+
+    return summary
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m midistuff.midi_parser",
+        description="Parse MIDI files and write a JSON Lines summary per file")
+    arg_parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    arg_parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    arg_parser.add_argument("-o", "--output", default="-", help="output file, - for stdout")
+    args = arg_parser.parse_args(argv)
+
+    file_names = list(find_files(args.paths))
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    total_bytes = 0
+    total_events = 0
+    failures = 0
+    start = time.perf_counter()
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+            for summary in executor.map(summarise, file_names, chunksize=16):
+                output.write(json.dumps(summary) + "\n")
+
+                total_bytes += summary["size"] or 0
+                total_events += summary.get("events", 0)
+                failures += summary["error"] is not None
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print("{} files, {} failed, {:.1f} MB/s, {:,.0f} events/s in {:.2f}s".format(
+        len(file_names), failures, total_bytes / elapsed / 2**20,
+        total_events / elapsed, elapsed), file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import midistuff.midi_parser.events as events
+import midistuff.midi_parser.parser as parser
+from midistuff.midi_parser.table import EventTable
+import tempfile
+import hashlib
+import logging
+import struct
+import mmap
+import sys
+import os
+
+
+MAGIC = b'MSPC'
+
+# magic, parser version, byte order, raw MThd chunk, track count
+_HEADER = struct.Struct("<4sHH14sI6x")
+# chunk size, row count, meta count
+_TRACK = struct.Struct("<III4x")
+# meta type, abs time, delta time, payload length
+_META = struct.Struct("<BQII")
+
+_BYTE_ORDERS = {"little": 0, "big": 1}
+
+
+def _padding(size):
+    return b'\x00' * (-size % 8)
+
+
+class ParseCache:
+    def __init__(self, directory, max_size=512 * 2**20):
+        self.directory = directory
+        self.max_size = max_size
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return "ParseCache(directory={}, max_size={})".format(
+            self.directory, self.max_size)
+
+    def key(self, file_name):
+        stat = os.stat(file_name)
+        digest = hashlib.sha1()
+
+        with open(file_name, "rb") as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                digest.update(block)
+
+        return "{}-{}-{}".format(
+            digest.hexdigest(), stat.st_size, stat.st_mtime_ns)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".mspc")
+
+    def load(self, file_name, workers=None):
+        key = self.key(file_name)
+        path = self.path(key)
+
+        # Other processes may evict or replace the entry at any point, a
+        # mapped entry stays readable after it is removed
+        try:
+            midi_file = self.read(path, file_name)
+        except FileNotFoundError:
+            midi_file = None
+        else:
+            if midi_file is None:
+                self._remove(path)
+
+        if midi_file is not None:
+            # Entry mtimes double as the LRU order
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+
+            return midi_file
+
+        midi_file = parser.MidiFile(file_name, workers=workers)
+        self.write(path, midi_file)
+        self.evict()
+
+        return midi_file
+
+    def write(self, path, midi_file):
+        header_data = b'MThd' + b''.join(value.to_bytes(size, "big") for value, size in (
+            (midi_file.header.chunk_size, 4), (midi_file.header.format_type, 2),
+            (midi_file.header.track_count, 2), (midi_file.header.time_division, 2)))
+
+        # Each writer has its own temporary file, so processes warming the
+        # same entry replace it in turn rather than writing into each other
+        descriptor, temp_path = tempfile.mkstemp(".tmp", dir=self.directory)
+        try:
+            # mkstemp files are private, entries are shared like before
+            os.chmod(temp_path, 0o644)
+
+            with open(descriptor, "wb") as file:
+                file.write(_HEADER.pack(
+                    MAGIC, parser.PARSER_VERSION, _BYTE_ORDERS[sys.byteorder],
+                    header_data, len(midi_file.chunks)))
+
+                for chunk in midi_file.chunks:
+                    file.write(self._pack_table(
+                        chunk.chunk_size, EventTable.from_track(chunk)))
+
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _pack_table(self, chunk_size, table):
+        metas = bytearray()
+        for event in table.meta_events:
+            payload = bytes(event._data)
+            metas += _META.pack(event.meta_type, event.abs_delta_time,
+                                event.delta_time, len(payload)) + payload
+
+        # 8 byte columns first so every column stays aligned
+        columns = b''.join([
+            table.abs_time.tobytes(), table.delta_time.tobytes(),
+            table.meta_rows.tobytes(), table.status.tobytes(),
+            table.channel.tobytes(), table.data1.tobytes(),
+            table.data2.tobytes()])
+
+        return b''.join([
+            _TRACK.pack(chunk_size, len(table), len(table.meta_events)),
+            columns, _padding(len(columns)), metas, _padding(len(metas))])
+
+    def read(self, path, file_name=None):
+        # Returns None for stale or damaged entries, so they are parsed again
+        try:
+            return self._read(path, file_name)
+        except (struct.error, ValueError, IndexError, parser.InvalidMidiFile) as error:
+            logging.info(f'CORRUPT CACHE ENTRY {path}: {error}')
+            return None
+
+    def _read(self, path, file_name):
+        with open(path, "rb") as file:
+            data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+        if len(data) < _HEADER.size:
+            return None
+
+        magic, version, byte_order, header_data, track_count = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != parser.PARSER_VERSION or byte_order != _BYTE_ORDERS[sys.byteorder]:
+            logging.info(f'STALE CACHE ENTRY {path}')
+            return None
+
+        chunks = []
+        offset = _HEADER.size
+        for _ in range(track_count):
+            chunk_size, table, offset = self._unpack_table(data, offset)
+            chunks.append(parser.MTrk(parser._chunk_header(chunk_size), table))
+
+        if offset != len(data):
+            raise ValueError("Unexpected entry size")
+
+        return parser.MidiFile.from_chunks(
+            parser.MThd(header_data), chunks, file_name)
+
+    def _unpack_table(self, data, offset):
+        chunk_size, row_count, meta_count = _TRACK.unpack_from(data, offset)
+        offset += _TRACK.size
+
+        # Columns are read-only views straight into the mapped snapshot, so
+        # cached tables can be read, copied or converted but not appended to
+        table = EventTable()
+        for name, typecode, count in (
+                ("abs_time", "Q", row_count), ("delta_time", "I", row_count),
+                ("meta_rows", "I", meta_count), ("status", "B", row_count),
+                ("channel", "B", row_count), ("data1", "B", row_count),
+                ("data2", "B", row_count)):
+            size = count * getattr(table, name).itemsize
+            if offset + size > len(data):
+                raise ValueError("Truncated column")
+
+            setattr(table, name, data[offset:offset+size].cast(typecode))
+            offset += size
+
+        offset += -offset % 8
+        for _ in range(meta_count):
+            meta_type, abs_time, delta_time, length = _META.unpack_from(data, offset)
+            offset += _META.size
+            if offset + length > len(data):
+                raise ValueError("Truncated meta event")
+
+            event = events.get_event(
+                delta_time, 255, data[offset:offset+length], meta_type)
+            if event is None:
+                raise ValueError("Unknown meta type {}".format(meta_type))
+
+            event.abs_delta_time = abs_time
+            table.meta_events.append(event)
+            offset += length
+
+        offset += -offset % 8
+
+        return chunk_size, table, offset
+
+    def entries(self):
+        return [entry for entry in os.scandir(self.directory)
+                if entry.name.endswith(".mspc")]
+
+    def _entry_stats(self):
+        # (mtime, size, path) per entry, oldest first. Entries another
+        # process removed since the listing are left out.
+        stats = []
+        for entry in self.entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            stats.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return sorted(stats)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        entries = self._entry_stats()
+        total = sum(size for mtime, size, path in entries)
+
+        # Oldest entries first, but never the one just written
+        while total > self.max_size and len(entries) > 1:
+            mtime, size, path = entries.pop(0)
+            total -= size
+            self._remove(path)
+
+    def clear(self):
+        for entry in self.entries():
+            self._remove(entry.path)
@@ -1,181 +1,256 @@
 import logging
-import math
 
 
 class MidiEvent:
-    def __init__(self, delta_time, event, channel):
-        self.event = event
-        self.delta_time = delta_time
+    __slots__ = ("delta_time", "abs_delta_time", "channel")
+
+    # Constant per event type, so kept on the class rather than per instance
+    event = None
+    is_meta = False
+    param_count = 1
 
-        self.is_meta = False
-        self.param_count = 1
+    def __init__(self, delta_time, channel):
+        self.delta_time = delta_time
+        self.abs_delta_time = 0
 
         self.channel = channel
 
         if channel is not None:
             self.channel += 1
-    
-    
-    def _get_bits_from_byte(self, byte):
-        return [(byte >> i) & 1 for i in reversed(range(0, 8))]
-    
-    
+
     def delta_time_bytes(self):
-        delta_time = []
-        for byte in self.delta_time.to_bytes(0, math.ceil(self.delta_time / 255), "big"):
-            delta_time += self._get_bits_from_byte(byte)
+        from midistuff.midi_parser.writer import encode_var_len
+
+        return encode_var_len(self.delta_time)
 
 
 class NoteOffEvent(MidiEvent):
+    __slots__ = ("note", "velocity", "release_velocity")
+    event = 8
+    param_count = 2
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 8, channel)
-        self.param_count = 2
+        super().__init__(delta_time, channel)
 
         self.note = data[0]
         self.velocity = 0
+        self.release_velocity = data[1]
+
+    def params(self):
+        return self.note, self.release_velocity
 
 
 class NoteOnEvent(MidiEvent):
+    __slots__ = ("note", "velocity")
+    event = 9
+    param_count = 2
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 9, channel)
-        self.param_count = 2
+        super().__init__(delta_time, channel)
 
         self.note = data[0]
         self.velocity = data[1]
 
+    def params(self):
+        return self.note, self.velocity
+
 
 class NoteAftertouchEvent(MidiEvent):
+    __slots__ = ("note", "velocity")
+    event = 10
+    param_count = 2
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 10, channel)
-        self.param_count = 2
+        super().__init__(delta_time, channel)
 
         self.note = data[0]
         self.velocity = data[1]
 
+    def params(self):
+        return self.note, self.velocity
+
 
 class ControllerEvent(MidiEvent):
+    __slots__ = ("controller_type", "value")
+    event = 11
+    param_count = 2
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 11, channel)
-        self.param_count = 2
+        super().__init__(delta_time, channel)
 
         self.controller_type = data[0]
         self.value = data[1]
 
+    def params(self):
+        return self.controller_type, self.value
+
 
 class ProgramChangeEvent(MidiEvent):
+    __slots__ = ("program_number",)
+    event = 12
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 12, channel)
+        super().__init__(delta_time, channel)
 
         self.program_number = data[0]
 
+    def params(self):
+        return self.program_number, 0
+
 
 class ChannelAftertouchEvent(MidiEvent):
+    __slots__ = ("velocity",)
+    event = 13
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 13, channel)
+        super().__init__(delta_time, channel)
 
         self.velocity = data[0]
 
+    def params(self):
+        return self.velocity, 0
+
 
 class PitchBendEvent(MidiEvent):
+    __slots__ = ("value_lsb", "value_msb")
+    event = 14
+    param_count = 2
+
     def __init__(self, delta_time, data, channel):
-        super().__init__(delta_time, 14, channel)
-        self.param_count = 2
+        super().__init__(delta_time, channel)
 
         self.value_lsb = data[0]
         self.value_msb = data[1]
 
+    def params(self):
+        return self.value_lsb, self.value_msb
+
 
 class MetaEvent(MidiEvent):
-    def __init__(self, delta_time, meta_type):
-        super().__init__(delta_time, 255, None)
-        self.meta_type = meta_type
-        self.is_meta = True
+    __slots__ = ("_data",)
+    event = 255
+    is_meta = True
+    meta_type = None
+
+    def __init__(self, delta_time, data=b''):
+        super().__init__(delta_time, None)
+
+        # Raw payload, may be a view into the loaded file
+        self._data = data
+
+    def _decode_data(self, encoding="ascii"):
+        return bytes(self._data).decode(encoding)
 
 
 class SequenceNumberEvent(MetaEvent):
+    __slots__ = ("number_msb", "number_lsb")
+    meta_type = 0
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 0)
+        super().__init__(delta_time, data)
 
         self.number_msb = data[0]
         self.number_lsb = data[1]
 
 
 class TextEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 1)
+    __slots__ = ()
+    meta_type = 1
 
-        self.text = data.decode("ascii")
+    @property
+    def text(self):
+        return self._decode_data()
 
 
 class CopyrightNoticeEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 2)
+    __slots__ = ()
+    meta_type = 2
 
-        self.notice = data.decode("latin-1")
+    @property
+    def notice(self):
+        return self._decode_data("latin-1")
 
     def __repr__(self):
         return "Copyright: " + self.notice
 
 
 class TrackNameEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 3)
+    __slots__ = ()
+    meta_type = 3
 
-        self.name = data.decode("ascii")
+    @property
+    def name(self):
+        # Names are often written in a local code page, latin-1 never fails
+        return self._decode_data("latin-1")
 
     def __repr__(self):
         return f"TrackNameEvent(name={self.name})"
 
 
 class InstrumentNameEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 4)
+    __slots__ = ()
+    meta_type = 4
 
-        self.name = data.decode("ascii")
+    @property
+    def name(self):
+        # Names are often written in a local code page, latin-1 never fails
+        return self._decode_data("latin-1")
 
     def __repr__(self):
         return f"InstrumentNameEvent(name={self.name})"
 
 
 class LyricEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 5)
+    __slots__ = ()
+    meta_type = 5
 
-        self.lyric = data.decode("ascii")
+    @property
+    def lyric(self):
+        return self._decode_data()
 
 
 class MarkerEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 6)
+    __slots__ = ()
+    meta_type = 6
 
-        self.marker = data.decode("ascii")
+    @property
+    def marker(self):
+        return self._decode_data()
 
 
 class CuePointEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 7)
+    __slots__ = ()
+    meta_type = 7
 
-        self.cue = data.decode("ascii")
+    @property
+    def cue(self):
+        return self._decode_data()
 
 
 class MidiChannelPrefixEvent(MetaEvent):
+    __slots__ = ()
+    meta_type = 32
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 32)
+        super().__init__(delta_time, data)
 
         self.channel = 1 + data[0]
 
 
 class EndOfTrackEvent(MetaEvent):
-    def __init__(self, delta_time, data):
-        super().__init__(delta_time, 47)
+    __slots__ = ()
+    meta_type = 47
 
     def __repr__(self):
         return "EndOfTrack()"
 
 
 class SetTempoEvent(MetaEvent):
+    __slots__ = ("tempo",)
+    meta_type = 81
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 81)
+        super().__init__(delta_time, data)
 
         self.tempo = 60000000 / int.from_bytes(data, "big")
 
@@ -184,8 +259,11 @@ class SetTempoEvent(MetaEvent):
 
 
 class SMPTEOffsetEvent(MetaEvent):
+    __slots__ = ("hour", "minute", "secord", "frame", "sub_frame")
+    meta_type = 84
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 84)
+        super().__init__(delta_time, data)
 
         self.hour = data[0]
         self.minute = data[1]
@@ -197,8 +275,11 @@ class SMPTEOffsetEvent(MetaEvent):
 
 
 class TimeSignatureEvent(MetaEvent):
+    __slots__ = ("numerator", "denominator", "metro", "ttnds")
+    meta_type = 88
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 88)
+        super().__init__(delta_time, data)
 
         self.numerator = data[0]
         self.denominator = 2**data[1]
@@ -210,10 +291,14 @@ class TimeSignatureEvent(MetaEvent):
 
 
 class KeySignatureEvent(MetaEvent):
+    __slots__ = ("key", "scale")
+    meta_type = 89
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 89)
+        super().__init__(delta_time, data)
 
-        self.key = data[0]
+        # Sharps are positive and flats negative, as in enums.KeySignatureKey
+        self.key = int.from_bytes(data[:1], "big", signed=True)
         self.scale = data[1]
 
     def __repr__(self):
@@ -221,51 +306,55 @@ class KeySignatureEvent(MetaEvent):
 
 
 class SequencerSpecificEvent(MetaEvent):
+    __slots__ = ("manufacture_id", "data")
+    meta_type = 127
+
     def __init__(self, delta_time, data):
-        super().__init__(delta_time, 127)
+        super().__init__(delta_time, data)
 
         if data[0] == 0:
-            self.manufacture_id = int.from_bytes(data[:len(data)-3])
+            self.manufacture_id = int.from_bytes(data[:len(data)-3], "big")
             self.data = data[3:]
         else:
             self.manufacture_id = data[0]
             self.data = data[1:]
 
 
-def get_event(delta_time, event_type, data, meta_type=None, channel=None):
-    meta_events = {
-        0: SequenceNumberEvent,
-        1: TextEvent,
-        2: CopyrightNoticeEvent,
-        3: TrackNameEvent,
-        4: InstrumentNameEvent,
-        5: LyricEvent,
-        6: MarkerEvent,
-        7: CuePointEvent,
-        32: MidiChannelPrefixEvent,
-        47: EndOfTrackEvent,
-        81: SetTempoEvent,
-        84: SMPTEOffsetEvent,
-        88: TimeSignatureEvent,
-        89: KeySignatureEvent,
-        127: SequencerSpecificEvent
-    }
-
-    midi_events = {
-        8: NoteOffEvent,
-        9: NoteOnEvent,
-        10: NoteAftertouchEvent,
-        11: ControllerEvent,
-        12: ProgramChangeEvent,
-        13: ChannelAftertouchEvent,
-        14: PitchBendEvent
-    }
+META_EVENTS = {cls.meta_type: cls for cls in (
+    SequenceNumberEvent,
+    TextEvent,
+    CopyrightNoticeEvent,
+    TrackNameEvent,
+    InstrumentNameEvent,
+    LyricEvent,
+    MarkerEvent,
+    CuePointEvent,
+    MidiChannelPrefixEvent,
+    EndOfTrackEvent,
+    SetTempoEvent,
+    SMPTEOffsetEvent,
+    TimeSignatureEvent,
+    KeySignatureEvent,
+    SequencerSpecificEvent
+)}
+
+MIDI_EVENTS = {cls.event: cls for cls in (
+    NoteOffEvent,
+    NoteOnEvent,
+    NoteAftertouchEvent,
+    ControllerEvent,
+    ProgramChangeEvent,
+    ChannelAftertouchEvent,
+    PitchBendEvent
+)}
 
+
+def get_event(delta_time, event_type, data, meta_type=None, channel=None):
     if event_type == 255:
-        if meta_type in meta_events:
-            return meta_events[meta_type](delta_time, data)
+        if meta_type in META_EVENTS:
+            return META_EVENTS[meta_type](delta_time, data)
 
-    if event_type in midi_events:
-        return midi_events[event_type](delta_time, data, channel)
+    if event_type in MIDI_EVENTS:
+        return MIDI_EVENTS[event_type](delta_time, data, channel)
 
     logging.critical("NOT FOUND EVENT: " + str(event_type) + " (event type) " + str(meta_type) + " (meta type)")
@@ -0,0 +1,68 @@
+import midistuff.midi_parser.events as events
+import copy
+
+
+class EventFilter:
+    def __init__(self, kinds=None, channels=None, start=None, end=None):
+        # kinds are event classes, base classes select all their subclasses
+        # (MetaEvent for every meta event). channels are 1-based and only
+        # apply to channel events, ticks are selected from [start, end).
+        # Leaving out SetTempoEvent also leaves the tempo map without them.
+        if isinstance(kinds, type):
+            kinds = (kinds,)
+
+        self.kinds = None if kinds is None else tuple(kinds)
+        self.channels = None if channels is None else frozenset(channels)
+        self.start = start or 0
+        self.end = end
+
+        # Indexed by status byte and meta type, so the parser can decide on
+        # an event before decoding any of it
+        self.statuses = bytes(self._wants_status(status) for status in range(256))
+        self.meta_types = bytes(self._wants_meta(meta_type) for meta_type in range(256))
+
+    def __repr__(self):
+        return "EventFilter(kinds={}, channels={}, start={}, end={})".format(
+            self.kinds, self.channels, self.start, self.end)
+
+    def _wants_kind(self, cls):
+        return self.kinds is None or issubclass(cls, self.kinds)
+
+    def _wants_status(self, status):
+        cls = events.MIDI_EVENTS.get(status >> 4)
+        if cls is None or not self._wants_kind(cls):
+            return False
+
+        return self.channels is None or (status & 0x0F) + 1 in self.channels
+
+    def _wants_meta(self, meta_type):
+        # Unknown meta types would be dropped by get_event anyway
+        cls = events.META_EVENTS.get(meta_type)
+
+        return cls is not None and self._wants_kind(cls)
+
+    def matches(self, event):
+        if event.abs_delta_time < self.start:
+            return False
+
+        if self.end is not None and event.abs_delta_time >= self.end:
+            return False
+
+        if event.is_meta:
+            return bool(self.meta_types[event.meta_type])
+
+        return bool(self.statuses[(event.event << 4) | (event.channel - 1)])
+
+    def iter_matching(self, levents, last_time=0):
+        # Kept events are copies with their delta times rebased onto each
+        # other, the same as when the parser applies the filter. last_time
+        # is the tick of the event kept before levents.
+        for event in levents:
+            if self.matches(event):
+                event = copy.copy(event)
+                event.delta_time = event.abs_delta_time - last_time
+                last_time = event.abs_delta_time
+                yield event
+
+    def apply(self, levents):
+        return list(self.iter_matching(levents))
@@ -0,0 +1,155 @@
+import midistuff.midi_parser.events as events
+from midistuff.midi_parser.filters import EventFilter
+import collections
+import operator
+import array
+
+
+# Subtrees up to this level are scanned instead of descended
+_SCAN_LEVEL = 3
+
+_NOTE_FILTER = EventFilter(
+    (events.NoteOnEvent, events.NoteOffEvent, events.EndOfTrackEvent))
+
+
+class NoteIndex:
+    column_names = ("start", "end", "note", "velocity", "channel", "track")
+
+    def __init__(self, midi_file):
+        self.midi_file = midi_file
+
+        # One row per note, sorted by start tick. Notes sound over
+        # [start, end), notes still held at the end of their track end there.
+        self.start = array.array("Q")
+        self.end = array.array("Q")
+        self.note = array.array("B")
+        self.velocity = array.array("B")
+        self.channel = array.array("B")
+        self.track = array.array("H")
+
+        # Rows double as an implicit interval tree: row i is a node at the
+        # level of its number of trailing one bits, max_end holds the
+        # latest end in its subtree
+        self.max_end = array.array("Q")
+        self.max_level = -1
+
+        self._build()
+
+    def __repr__(self):
+        return "NoteIndex(note_count={})".format(len(self))
+
+    def __len__(self):
+        return len(self.start)
+
+    def columns(self):
+        return [getattr(self, name) for name in self.column_names]
+
+    def _pair_notes(self):
+        notes = []
+
+        for track, chunk in enumerate(self.midi_file.chunks):
+            # Repeated notes on the same key are released first in, first out
+            held = collections.defaultdict(collections.deque)
+            end_time = 0
+
+            for event in chunk.iter_events(_NOTE_FILTER):
+                end_time = event.abs_delta_time
+
+                if type(event) is events.NoteOnEvent and event.velocity:
+                    row = [event.abs_delta_time, None, event.note,
+                           event.velocity, event.channel, track]
+                    held[(event.channel, event.note)].append(row)
+                    notes.append(row)
+                elif not event.is_meta:
+                    rows = held.get((event.channel, event.note))
+                    if rows:
+                        rows.popleft()[1] = event.abs_delta_time
+
+            for rows in held.values():
+                for row in rows:
+                    row[1] = end_time
+
+        notes.sort(key=operator.itemgetter(0))
+
+        return notes
+
+    def _build(self):
+        for column, values in zip(self.columns(), zip(*self._pair_notes())):
+            column.extend(values)
+
+        ends = self.end
+        count = len(ends)
+        if not count:
+            return
+
+        max_end = self.max_end = array.array("Q", ends)
+
+        # Leaves are the even rows. last is the max end of the rightmost
+        # subtree at the current level, standing in for missing nodes.
+        last_row = count - 1 if (count - 1) % 2 == 0 else count - 2
+        last = max_end[last_row]
+
+        level = 1
+        while 1 << level <= count:
+            half = 1 << (level - 1)
+            for row in range((half << 1) - 1, count, half << 2):
+                left = max_end[row - half]
+                right = max_end[row + half] if row + half < count else last
+                max_end[row] = max(ends[row], left, right)
+
+            last_row = last_row - half if last_row >> level & 1 else last_row + half
+            if last_row < count and max_end[last_row] > last:
+                last = max_end[last_row]
+
+            level += 1
+
+        self.max_level = level - 1
+
+    def overlapping(self, start, end):
+        # Rows of the notes sounding anywhere in [start, end), in row order
+        count = len(self)
+        starts = self.start
+        ends = self.end
+        max_end = self.max_end
+        rows = []
+
+        if count:
+            stack = [(self.max_level, (1 << self.max_level) - 1, False)]
+        else:
+            stack = []
+
+        while stack:
+            level, row, visited = stack.pop()
+
+            if level <= _SCAN_LEVEL:
+                first = row >> level << level
+                last = min(first + (1 << (level + 1)) - 1, count)
+                for index in range(first, last):
+                    if starts[index] >= end:
+                        break
+                    if ends[index] > start:
+                        rows.append(index)
+            elif not visited:
+                stack.append((level, row, True))
+
+                left = row - (1 << (level - 1))
+                if left >= count or max_end[left] > start:
+                    stack.append((level - 1, left, False))
+            elif row < count and starts[row] < end:
+                if ends[row] > start:
+                    rows.append(row)
+
+                stack.append((level - 1, row + (1 << (level - 1)), False))
+
+        rows.sort()
+
+        return array.array("I", rows)
+
+    def sounding_at(self, tick):
+        return self.overlapping(tick, tick + 1)
+
+    def to_numpy(self):
+        import numpy
+
+        return {name: numpy.frombuffer(column, dtype=column.typecode)
+                for name, column in zip(self.column_names, self.columns())}
@@ -1,13 +1,297 @@
 import midistuff.midi_parser.events as events
-import threading
+import midistuff.midi_parser.writer as writer
+from midistuff.midi_parser.playback import Player, AsyncPlayer, CompiledPlayback
+from midistuff.midi_parser.tempo import TempoMap
+from midistuff.midi_parser.seek import SeekIndex, ChannelState
+from midistuff.midi_parser.notes import NoteIndex
+from midistuff.midi_parser.filters import EventFilter
+import collections
+import collections.abc
+import concurrent.futures
+import functools
+import itertools
+import operator
+import copy
+import math
+import heapq
+import bisect
+import array
 import logging
-import time
+import mmap
+import os
+
+
+# Bump whenever the decoder output changes, invalidates cached parses
+PARSER_VERSION = 2
 
 
 class InvalidMidiFile(Exception):
     pass
 
 
+# Everything scan() reports on, the rest is stepped over unread
+_SCAN_FILTER = EventFilter((
+    events.NoteOnEvent, events.CopyrightNoticeEvent, events.TrackNameEvent,
+    events.InstrumentNameEvent, events.SetTempoEvent, events.TimeSignatureEvent,
+    events.KeySignatureEvent, events.EndOfTrackEvent))
+
+
+# Data bytes following each channel event status nibble
+_PARAM_COUNTS = {event_type: cls.param_count
+                 for event_type, cls in events.MIDI_EVENTS.items()}
+
+# Meta types that decode to an event, the rest are skipped
+_META_TYPES = frozenset(events.META_EVENTS)
+
+
+def read_var_len(data, index):
+    value = 0
+    start = index
+
+    while True:
+        byte = data[index]
+        index += 1
+        value = (value << 7) | (byte & 0x7F)
+
+        if byte < 0x80:
+            return value, index - start
+
+
+def iter_raw_events(data, state=None, event_filter=None):
+    # Yields (abs_time, delta_time, status, data1, data2, payload) tuples.
+    # Meta events have status 0xFF, data1 set to the meta type and payload
+    # set to a slice of data, channel events have a payload of None.
+    #
+    # state is an optional [pos, running status, abs_time, last_time] list
+    # to resume from, updated after every complete event. A truncated event
+    # raises IndexError and leaves state pointing at its first byte.
+    #
+    # Sysex events, unknown meta types and events rejected by event_filter
+    # are stepped over, delta times are relative to the previous event
+    # yielded.
+    if event_filter is not None:
+        yield from _iter_filtered_raw_events(data, event_filter, state)
+        return
+
+    end = len(data)
+    if state is None:
+        pos, status, abs_time, last_time = 0, None, 0, 0
+    else:
+        pos, status, abs_time, last_time = state
+
+    while pos + 1 < end:
+        byte = data[pos]
+        pos += 1
+        delta_time = byte & 0x7F
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            delta_time = (delta_time << 7) | (byte & 0x7F)
+
+        abs_time += delta_time
+        byte = data[pos]
+
+        # Meta event
+        if byte == 0xFF:
+            meta_type = data[pos+1]
+            length, length_len = read_var_len(data, pos+2)
+            pos += 2 + length_len + length
+            if pos > end:
+                raise IndexError("Truncated meta event")
+
+            # Unknown meta types are skipped like sysex
+            if meta_type in _META_TYPES:
+                delta_time, last_time = abs_time - last_time, abs_time
+
+            if state is not None:
+                state[:] = pos, status, abs_time, last_time
+
+            if meta_type in _META_TYPES:
+                yield abs_time, delta_time, 0xFF, meta_type, 0, data[pos-length:pos]
+            continue
+
+        # Sysex event, skipped
+        if byte == 0xF0 or byte == 0xF7:
+            length, length_len = read_var_len(data, pos+1)
+            pos += 1 + length_len + length
+            if pos > end:
+                raise IndexError("Truncated sysex event")
+
+            if state is not None:
+                state[:] = pos, status, abs_time, last_time
+
+            continue
+
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif status is None:
+            raise InvalidMidiFile("Running status without a status byte")
+
+        param_count = _PARAM_COUNTS.get(status >> 4)
+        if param_count is None:
+            raise InvalidMidiFile("Unexpected status byte {}".format(status))
+
+        if param_count == 2:
+            data1, data2 = data[pos], data[pos+1]
+        else:
+            data1, data2 = data[pos], 0
+        pos += param_count
+        delta_time, last_time = abs_time - last_time, abs_time
+
+        if state is not None:
+            state[:] = pos, status, abs_time, last_time
+
+        yield abs_time, delta_time, status, data1, data2, None
+
+
+def _iter_filtered_raw_events(data, event_filter, state=None):
+    # Same walk as iter_raw_events, kept separate so unfiltered parsing
+    # doesn't pay for the checks
+    statuses = event_filter.statuses
+    meta_types = event_filter.meta_types
+    start = event_filter.start
+    stop = event_filter.end
+
+    end = len(data)
+    if state is None:
+        pos, status, abs_time, last_time = 0, None, 0, 0
+    else:
+        pos, status, abs_time, last_time = state
+
+    while pos + 1 < end:
+        byte = data[pos]
+        pos += 1
+        delta_time = byte & 0x7F
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            delta_time = (delta_time << 7) | (byte & 0x7F)
+
+        abs_time += delta_time
+        if stop is not None and abs_time >= stop:
+            return
+
+        byte = data[pos]
+
+        # Meta event
+        if byte == 0xFF:
+            meta_type = data[pos+1]
+            length, length_len = read_var_len(data, pos+2)
+            pos += 2 + length_len + length
+            if pos > end:
+                raise IndexError("Truncated meta event")
+
+            kept = meta_types[meta_type] and abs_time >= start
+            if kept:
+                delta_time, last_time = abs_time - last_time, abs_time
+
+            if state is not None:
+                state[:] = pos, status, abs_time, last_time
+
+            if kept:
+                yield abs_time, delta_time, 0xFF, meta_type, 0, data[pos-length:pos]
+            continue
+
+        # Sysex event, skipped
+        if byte == 0xF0 or byte == 0xF7:
+            length, length_len = read_var_len(data, pos+1)
+            pos += 1 + length_len + length
+            if pos > end:
+                raise IndexError("Truncated sysex event")
+
+            if state is not None:
+                state[:] = pos, status, abs_time, last_time
+            continue
+
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif status is None:
+            raise InvalidMidiFile("Running status without a status byte")
+
+        param_count = _PARAM_COUNTS.get(status >> 4)
+        if param_count is None:
+            raise InvalidMidiFile("Unexpected status byte {}".format(status))
+
+        pos += param_count
+        if pos > end:
+            raise IndexError("Truncated channel event")
+
+        kept = statuses[status] and abs_time >= start
+        if kept:
+            delta_time, last_time = abs_time - last_time, abs_time
+
+        if state is not None:
+            state[:] = pos, status, abs_time, last_time
+
+        if kept:
+            if param_count == 2:
+                yield abs_time, delta_time, status, data[pos-2], data[pos-1], None
+            else:
+                yield abs_time, delta_time, status, data[pos-1], 0, None
+
+
+def _group_offsets(levents):
+    # Index of the first event of every tick, followed by the event count
+    offsets = array.array("I", [0] if levents else [])
+    times = [event.abs_delta_time for event in levents]
+
+    offsets.extend(itertools.compress(
+        range(1, len(times)), map(operator.ne, times[1:], times)))
+    offsets.append(len(times))
+
+    return offsets
+
+
+class _AbsTimes(collections.abc.Sequence):
+    # Ticks of a track as a sequence bisect can search, without a copy
+    __slots__ = ("events",)
+
+    def __init__(self, levents):
+        self.events = levents
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, index):
+        return self.events[index].abs_delta_time
+
+
+class EventGroup(collections.abc.Sequence):
+    # A view of the events sharing a tick, no list is built for it
+    __slots__ = ("events", "start", "end")
+
+    def __init__(self, levents, start, end):
+        self.events = levents
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "EventGroup(tick={}, event_count={})".format(self.tick, len(self))
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.events[self.start:self.end][index]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("EventGroup index out of range")
+
+        return self.events[self.start + index]
+
+    def __iter__(self):
+        return map(self.events.__getitem__, range(self.start, self.end))
+
+    @property
+    def tick(self):
+        return self.events[self.start].abs_delta_time
+
+
 class MThd:
     chunk_id = "MThd"
 
@@ -28,168 +312,482 @@ class MThd:
 class MTrk:
     chunk_id = "MTrk"
 
-    def __init__(self, header_data):
+    def __init__(self, header_data, source=None, event_filter=None):
         if header_data[:4] != b'MTrk':
             raise InvalidMidiFile("Invalid midi file!")
 
         self.chunk_size = int.from_bytes(header_data[4:8], "big")
-        self.events = []
         self.last_read_event = None
         self.last_index = -1
+        self._group = 0
+        self._group_offsets = None
+
+        # Track body (or a callable returning it) decoded on first access
+        self._source = source
+        self._events = None if source is not None else []
+        self.event_filter = event_filter
+
+        # Decoder state kept between feed() calls
+        self._tail = b''
+        self._status = None
+        self._abs_time = 0
+        self._last_time = 0
+        self._finished = False
 
     def __repr__(self):
         return "MTrk(chunk_size={}, event_count={})".format(
-            self.chunk_size, len(self.events))
+            self.chunk_size, self.event_count)
 
-    def _find_var_len_data(self, data, index):
-        var_len_data = []
+    @property
+    def events(self):
+        if self._events is None:
+            self._load_source()
 
-        for byte_index in range(0, len(data[index:])):
-            bits = self._get_bits_from_byte(data[index+byte_index])
-            cont_bit = bits.pop(0)
-            var_len_data += bits
+        return self._events
 
-            if cont_bit == 0:
-                break
+    @events.setter
+    def events(self, value):
+        self._source = None
+        self._events = value
+        self._group_offsets = None
 
-        return self._correct_byte(var_len_data), byte_index+1
+    @property
+    def group_offsets(self):
+        if self._group_offsets is None:
+            self._group_offsets = _group_offsets(self.events)
 
-    def _get_bits_from_byte(self, byte):
-        return [(byte >> i) & 1 for i in reversed(range(0, 8))]
+        return self._group_offsets
 
-    def _correct_byte(self, byte_list):
-        byte = [0 for x in range(0, 8-(len(byte_list) % 8))] + byte_list
-        return int("".join(map(lambda b: str(b), byte)), 2)
+    @property
+    def is_loaded(self):
+        return self._events is not None
 
-    def _load_data(self, data):
-        loaded_data = 0
-        delta_time_total = 0
-
-        while loaded_data + 1 < self.chunk_size:
-            # start_loaded_data = loaded_data
-            # Meta event
-            delta_time, data_loaded = self._find_var_len_data(data,
-                                                              loaded_data)
-            delta_time_total += delta_time
-            loaded_data += data_loaded
-
-            if data[loaded_data] == 255:
-                event_type = 255
-                meta_type = data[loaded_data+1]
-                length, length_len = self._find_var_len_data(
-                    data, loaded_data+2)
-                event_data = data[
-                    loaded_data+2+length_len:loaded_data+2+length_len+length]
-
-                loaded_data += 2+length_len+length
-
-                event = events.get_event(
-                    delta_time, event_type, event_data, meta_type)
-
-                if event is not None:
-                    event.abs_delta_time = delta_time_total
-                    self.events.append(event)
-            else:
-                bits = self._get_bits_from_byte(data[loaded_data])
-                event_type = self._correct_byte(bits[:4])
+    @property
+    def event_count(self):
+        # Tables are counted without building their events
+        source = self._source
+        if self._events is None and self.event_filter is None and hasattr(source, "meta_events"):
+            return len(source) + len(source.meta_events)
 
-                channel = self._correct_byte(bits[4:])
-                param1 = data[loaded_data+1]
-                param2 = data[loaded_data+2]
+        return len(self.events)
 
-                loaded_data += 2
-                event = events.get_event(
-                    delta_time, event_type, [param1, param2], channel=channel)
+    def iter_meta_events(self):
+        # Tables keep meta events as objects, so no need to build the rest
+        if self._events is None and hasattr(self._source, "meta_events"):
+            return iter(self._source.meta_events)
 
-                if event is None:
-                    logging.debug("Assuming running status")
+        return (event for event in self.iter_events() if event.is_meta)
 
-                    loaded_data -= 2
+    def _load_source(self):
+        source = self._read_source()
+        self._source = None
 
-                    param1 = data[loaded_data]
-                    param2 = data[loaded_data+1]
+        # Tracks decoded in another process hand over a table, not bytes
+        if hasattr(source, "to_events"):
+            self._events = source.to_events(self.event_filter)
+        else:
+            self._load_data(source)
 
-                    event = self.events[-1]
-                    event = events.get_event(
-                        event.delta_time, event.event, [param1, param2],
-                        channel=event.channel)
+    def _find_var_len_data(self, data, index):
+        return read_var_len(data, index)
 
-                    loaded_data += 1
+    def _load_data(self, data):
+        if self._events is None:
+            self._events = []
+
+        self._events.extend(self._iter_data(data, event_filter=self.event_filter))
+
+    def feed(self, data):
+        # Decodes bytes appended to the track body since the last call and
+        # returns the new events. An event cut off at the end of data is
+        # kept and completed by the next call, anything after EndOfTrack is
+        # left in _tail for the caller.
+        if self._events is None:
+            self._load_source()
+
+        buffer = self._tail + bytes(data)
+        state = [0, self._status, self._abs_time, self._last_time]
+        new_events = []
+
+        try:
+            for event in self._iter_data(buffer, state):
+                new_events.append(event)
+
+                if type(event) is events.EndOfTrackEvent:
+                    self._finished = True
+                    break
+        except IndexError:
+            pass
+
+        # The whole body is decoded to find EndOfTrack, the filter is applied
+        # after with deltas rebased onto the last event kept
+        if self.event_filter is not None:
+            last_time = self._events[-1].abs_delta_time if self._events else 0
+            new_events = list(self.event_filter.iter_matching(new_events, last_time))
+
+        self._tail = buffer[state[0]:]
+        self._status = state[1]
+        self._abs_time = state[2]
+        self._last_time = state[3]
+        self._events.extend(new_events)
+        self._group_offsets = None
+
+        return new_events
+
+    def iter_events(self, event_filter=None):
+        if self._events is not None:
+            levents = iter(self._events)
+        else:
+            # Undecoded tracks only build the events that pass the filter
+            source_filter = self.event_filter or event_filter
+            if source_filter is event_filter:
+                event_filter = None
+
+            source = self._read_source()
+            if hasattr(source, "to_events"):
+                levents = iter(source.to_events(source_filter))
+            else:
+                levents = self._iter_data(source, event_filter=source_filter)
 
-                self.events.append(event)
-                event.abs_delta_time = delta_time_total
+        if event_filter is not None:
+            return event_filter.iter_matching(levents)
 
-                if event.param_count == 2:
-                    loaded_data += 1
+        return levents
 
-            logging.debug("Loaded event: " + str(event))
-            # print(data[start_loaded_data:loaded_data])
+    def _read_source(self):
+        if callable(self._source):
+            return self._source()
 
-    def get_next_events(self):
-        last_event_index = self.last_index
-        if last_event_index + 1 >= len(self.events):
-            return None
+        return self._source
 
-        events = [self.events[last_event_index + 1]]
+    def _iter_data(self, data, state=None, event_filter=None):
+        get_event = events.get_event
 
-        for event_index in range(last_event_index + 1, len(self.events)):
-            if self.events[event_index].delta_time == 0:
-                events.append(self.events[event_index])
+        for abs_time, delta_time, status, data1, data2, payload in iter_raw_events(data, state, event_filter):
+            if status == 0xFF:
+                event = get_event(delta_time, 255, payload, data1)
+                if event is None:
+                    continue
             else:
-                break
+                event = get_event(
+                    delta_time, status >> 4, [data1, data2],
+                    channel=status & 0x0F)
+
+            event.abs_delta_time = abs_time
+            yield event
 
-        self.last_read_event = events[-1]
-        self.last_index = event_index - 1
+    def get_next_events(self):
+        # The events from last_index + 1 to the end of their tick
+        offsets = self.group_offsets
+        position = self.last_index + 1
+        if position >= offsets[-1]:
+            return None
+
+        # The cursor only needs finding again after seek() or reset()
+        group = self._group
+        if group + 1 >= len(offsets) or not offsets[group] <= position < offsets[group + 1]:
+            group = bisect.bisect_right(offsets, position) - 1
 
-        if len(events) == 1:
-            self.last_index += 1
+        end = offsets[group + 1]
+        self._group = group + 1
+        self.last_index = end - 1
+        self.last_read_event = self.events[end - 1]
 
-        return events
+        return EventGroup(self.events, position, end)
 
 
 class MidiFile:
-    def __init__(self, file):
+    def __init__(self, file, use_mmap=False, lazy=False, workers=None, tail=False,
+                 event_filter=None):
         self.file = file
         self._file = None
+        self._buffer = None
+        self.use_mmap = use_mmap
+        self.lazy = lazy
+        self.workers = workers
+        self.tail = tail
+        self.event_filter = event_filter
         self.header = None
 
+        # Tail mode: bytes of the file consumed so far and an incomplete
+        # chunk header waiting for the rest of its bytes
+        self._tail_offset = 0
+        self._pending = b''
+
         self.tempo = 120
-        self.time_sig = None
-        self.key_sig = None
-        self.copyright_notice = None
+        self._meta = None
 
         self.chunks = []
+        self._tempo_map = None
+        self._seek_index = None
+        self._note_index = None
+
+        if file is not None:
+            self._open()
+
+            if not self.lazy:
+                self._tempo_map = TempoMap.from_midi_file(self)
+
+    @property
+    def meta(self):
+        # The first time signature, key signature and copyright notice of
+        # the file, read on first use and again after the events change
+        if self._meta is None:
+            meta = {"time_sig": None, "key_sig": None, "copyright_notice": None}
+
+            for chunk in self.chunks:
+                for event in chunk.iter_meta_events():
+                    if type(event) is events.TimeSignatureEvent and meta["time_sig"] is None:
+                        meta["time_sig"] = (event.numerator, event.denominator)
+                    elif type(event) is events.KeySignatureEvent and meta["key_sig"] is None:
+                        meta["key_sig"] = (event.key, event.scale)
+                    elif type(event) is events.CopyrightNoticeEvent and meta["copyright_notice"] is None:
+                        meta["copyright_notice"] = event.notice
+
+            self._meta = meta
+
+        return self._meta
 
-        self._open()
+    @property
+    def time_sig(self):
+        return self.meta["time_sig"]
+
+    @property
+    def key_sig(self):
+        return self.meta["key_sig"]
+
+    @property
+    def copyright_notice(self):
+        return self.meta["copyright_notice"]
+
+    @classmethod
+    def from_chunks(cls, header, chunks, file=None):
+        midi_file = cls(None)
+        midi_file.file = file
+        midi_file.header = header
+        midi_file.chunks = list(chunks)
+
+        return midi_file
 
     def _open(self):
-        with open(self.file, "rb", buffering=0) as file:
+        if self.tail:
+            self._open_tail()
+        elif self.workers and self.workers > 1 and not self.lazy:
+            self._open_parallel()
+        elif self.use_mmap:
+            self._open_mmap()
+        elif self.lazy:
+            self._open_lazy()
+        else:
+            with open(self.file, "rb", buffering=0) as file:
 
-            # Read header chunk
-            self.header = MThd(file.read(14))
+                # Read header chunk
+                self.header = MThd(file.read(14))
 
-            for chunk_index in range(0, self.header.track_count):
-                self.chunks.append(self._read_next_chunk(file))
+                for chunk_index in range(0, self.header.track_count):
+                    self.chunks.append(self._read_next_chunk(file))
 
-        logging.info(f'LOADED {len(self.chunks)} CHUNKS AND {sum([len(chunk.events) for chunk in self.chunks])} EVENTS')
+        if self.lazy:
+            logging.info(f'INDEXED {len(self.chunks)} CHUNKS')
+        else:
+            logging.info(f'LOADED {len(self.chunks)} CHUNKS AND {sum(chunk.event_count for chunk in self.chunks)} EVENTS')
 
     def _read_next_chunk(self, file):
-        chunk = MTrk(file.read(8))
+        chunk = MTrk(file.read(8), event_filter=self.event_filter)
         chunk._load_data(file.read(chunk.chunk_size))
 
         return chunk
 
+    def _open_mmap(self):
+        # The mapping stays alive for as long as any view into it does,
+        # so meta payloads can keep referencing it after the file closes
+        with open(self.file, "rb") as file:
+            self._buffer = memoryview(
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+        data = self._buffer
+        self.header = MThd(data[:14])
+
+        for offset, size in self._index_chunks(data):
+            body = data[offset+8:offset+8+size]
+
+            if self.lazy:
+                chunk = MTrk(data[offset:offset+8], body, self.event_filter)
+            else:
+                chunk = MTrk(data[offset:offset+8], event_filter=self.event_filter)
+                chunk._load_data(body)
+
+            self.chunks.append(chunk)
+
+    def _open_lazy(self):
+        with open(self.file, "rb") as file:
+            self.header = MThd(file.read(14))
+            index = self._index_file_chunks(file)
+
+        for offset, size in index:
+            self.chunks.append(MTrk(_chunk_header(size), functools.partial(
+                self._read_chunk_body, offset + 8, size), self.event_filter))
+
+    def _open_tail(self):
+        with open(self.file, "rb") as file:
+            self.header = MThd(_read_exact(file, 14))
+
+        self._tail_offset = 8 + self.header.chunk_size
+        self.update()
+
+    def update(self):
+        # Decodes whatever was appended to the file since the last call and
+        # returns the new events. Recorders usually only fill in chunk sizes
+        # when closing the file, so tracks are delimited by EndOfTrack.
+        with open(self.file, "rb") as file:
+            file.seek(self._tail_offset)
+            appended = file.read()
+
+        self._tail_offset += len(appended)
+        data = self._pending + appended
+        new_events = []
+
+        while data:
+            if not self.chunks or self.chunks[-1]._finished:
+                if len(data) < 8:
+                    break
+
+                self.chunks.append(MTrk(data[:8], event_filter=self.event_filter))
+                data = data[8:]
+
+            chunk = self.chunks[-1]
+            new_events.extend(chunk.feed(data))
+            data = b''
+
+            # Bytes past EndOfTrack belong to the next chunk
+            if chunk._finished:
+                data, chunk._tail = chunk._tail, b''
+
+        self._pending = data
+
+        if new_events:
+            self._invalidate()
+
+        return new_events
+
+    def _open_parallel(self):
+        with open(self.file, "rb") as file:
+            self.header = MThd(file.read(14))
+            index = self._index_file_chunks(file)
+
+        # Workers read their own chunk bodies and send back compact event
+        # tables, unpickling event objects would cost more than parsing.
+        # Each track builds its objects from the table on first access.
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            tables = executor.map(
+                _decode_chunk, itertools.repeat(self.file),
+                [offset + 8 for offset, size in index],
+                [size for offset, size in index],
+                itertools.repeat(self.event_filter))
+
+            for (offset, size), table in zip(index, tables):
+                self.chunks.append(MTrk(_chunk_header(size), table))
+
+    def _index_file_chunks(self, file):
+        chunks = []
+        file_size = os.fstat(file.fileno()).st_size
+
+        offset = 8 + self.header.chunk_size
+        while len(chunks) < self.header.track_count and offset + 8 <= file_size:
+            file.seek(offset)
+            header_data = file.read(8)
+            size = int.from_bytes(header_data[4:8], "big")
+            if offset + 8 + size > file_size:
+                raise InvalidMidiFile("Truncated chunk at byte {}".format(offset))
+
+            # Unknown chunk types are skipped as the spec requires
+            if header_data[:4] == b'MTrk':
+                chunks.append((offset, size))
+
+            offset += 8 + size
+
+        return chunks
+
+    def _read_chunk_body(self, offset, size):
+        with open(self.file, "rb") as file:
+            file.seek(offset)
+            return file.read(size)
+
+    def _index_chunks(self, data):
+        return _index_chunks(self.header, data)
+
     def get_next_events(self):
         if self.header.format_type == 1:
-            events = []
-            for chunk in self.chunks:
-                events.append(chunk.get_next_events())
+            return [chunk.get_next_events() for chunk in self.chunks]
 
-            return events
-        elif self.header.format_type == 2:
-            for chunk in self.chunks:
-                if type(chunk.last_read_event) is not events.EndOfTrackEvent:
-                    return chunk.get_next_events()
+        # Format 0 has a single track, format 2 plays its tracks in turn
+        for chunk in self.chunks:
+            if type(chunk.last_read_event) is not events.EndOfTrackEvent:
+                return chunk.get_next_events()
+
+    def iter_tick_groups(self):
+        # Yields (tick, groups) in tick order, with a view of the events at
+        # tick for every track that has any
+        tracks = [(chunk.events, chunk.group_offsets) for chunk in self.chunks]
+        heap = [(levents[0].abs_delta_time, track, 0)
+                for track, (levents, offsets) in enumerate(tracks) if levents]
+        heapq.heapify(heap)
+
+        while heap:
+            tick = heap[0][0]
+            groups = []
+
+            while heap and heap[0][0] == tick:
+                tick, track, group = heapq.heappop(heap)
+                levents, offsets = tracks[track]
+                end = offsets[group + 1]
+                groups.append(EventGroup(levents, offsets[group], end))
+
+                if end < len(levents):
+                    heapq.heappush(heap, (levents[end].abs_delta_time, track, group + 1))
+
+            yield tick, groups
+
+    def iter_events(self, track=None, merged=True, event_filter=None):
+        if track is not None:
+            return self.chunks[track].iter_events(event_filter)
+
+        iterators = [chunk.iter_events(event_filter) for chunk in self.chunks]
+        if merged and self.header.format_type == 1:
+            return _merge_events(iterators)
+
+        return itertools.chain(*iterators)
+
+    def _invalidate(self):
+        # Derived indexes are rebuilt on next use after the events change
+        self._tempo_map = None
+        self._meta = None
+        self._seek_index = None
+        self._note_index = None
+
+    @property
+    def tempo_map(self):
+        if self._tempo_map is None:
+            self._tempo_map = TempoMap.from_midi_file(self)
+
+        return self._tempo_map
+
+    def sequence_offsets(self):
+        # Tick each track starts at on the file's timeline. Format 2 tracks
+        # are sequences played one after another, the rest all start at 0.
+        offsets = [0] * len(self.chunks)
+        if self.header.format_type == 2:
+            for track in range(1, len(self.chunks)):
+                levents = self.chunks[track - 1].events
+                offsets[track] = offsets[track - 1] + (levents[-1].abs_delta_time if levents else 0)
+
+        return offsets
+
+    def tick_to_seconds(self, tick):
+        return self.tempo_map.tick_to_seconds(tick)
+
+    def seconds_to_tick(self, seconds):
+        return self.tempo_map.seconds_to_tick(seconds)
 
     def get_delta_time_in_seconds(self, delta_time):
         return (60 * delta_time) / (self.tempo * self.header.time_division)
@@ -202,65 +800,344 @@ class MidiFile:
             elif type(event) is events.SetTempoEvent:
                 self.tempo = event.tempo
 
-    def _play(self, chunk, controller):
-        last_events = []
-        last_clock = 0
+    @property
+    def seek_index(self):
+        if self._seek_index is None:
+            self._seek_index = SeekIndex(self)
 
-        while last_events is not None:
-            if last_events == []:
-                last_events = chunk.get_next_events()
-                last_clock = time.time()
-                continue
+        return self._seek_index
 
-            try:
-                self._busy_wait(
-                    self.get_delta_time_in_seconds(last_events[0].delta_time) - (time.time() - last_clock))
-            except Exception:
-                pass
+    def seek(self, seconds=None, tick=None):
+        if tick is None:
+            tick = self.seconds_to_tick(seconds or 0)
 
-            last_clock = time.time()
+        positions, state = self.seek_index.seek(tick)
 
-            thread = threading.Thread(
-                target=self._play_events, args=[last_events, controller])
-            thread.daemon = True
-            thread.start()
+        for chunk, position in zip(self.chunks, positions):
+            chunk.last_index = position - 1
+            chunk.last_read_event = chunk.events[position - 1] if position else None
 
-            last_events = chunk.get_next_events()
-            if last_events[-1].__class__ == events.EndOfTrackEvent:
-                return
+        self.tempo = state.tempo
+
+        return positions, state
+
+    def slice(self, start=0, end=None, seconds=False):
+        # New file with the events in [start, end), moved to start at tick
+        # 0. The tempo, programs, controllers and notes held at start open
+        # the first track, notes still held at end are closed at end.
+        if seconds:
+            start = math.ceil(self.seconds_to_tick(start))
+            end = None if end is None else math.ceil(self.seconds_to_tick(end))
+
+        positions, state = self.seek_index.seek(start)
 
-    def play(self, controller):
+        if self.header.format_type == 2:
+            chunks = self._slice_sequences(positions, state, start, end)
+        else:
+            chunks = self._slice_tracks(self.chunks, positions, state, start, end)
+
+        return MidiFile.from_chunks(self.header, chunks, self.file)
+
+    def _slice_sequences(self, positions, state, start, end):
+        # Each format 2 sequence is sliced on its own ticks. The state at
+        # start opens the first sequence kept, sequences outside the window
+        # are left with only their end.
+        chunks = []
+        for chunk, position, offset in zip(self.chunks, positions, self.sequence_offsets()):
+            levents = chunk.events
+            length = levents[-1].abs_delta_time if levents else 0
+
+            if position == len(levents) or (end is not None and offset >= end):
+                event = events.EndOfTrackEvent(0)
+                event.abs_delta_time = 0
+                empty = MTrk(_chunk_header(0))
+                empty.events = [event]
+                chunks.append(empty)
+                continue
+
+            local_end = None if end is None or end - offset > length else end - offset
+            chunks += self._slice_tracks(
+                [chunk], [position], state, max(start - offset, 0), local_end)
+
+            # Later sequences start from their beginning
+            state = ChannelState()
+
+        return chunks
+
+    def _slice_tracks(self, chunks, positions, state, start, end):
+        # Chased notes open in the first track, closing events go to the
+        # track that opened the note
+        held = dict.fromkeys(state.held_notes, 0)
+        tracks = [[] for chunk in chunks]
+        tracks[0].append(events.SetTempoEvent(
+            0, round(60000000 / state.tempo).to_bytes(3, "big")))
+        for message in state.messages():
+            tracks[0].append(events.get_event(
+                0, message[0] >> 4, message[1:], channel=message[0] & 0x0F))
+
+        for track, (chunk, position) in enumerate(zip(chunks, positions)):
+            levents = chunk.events
+            stop = len(levents)
+            if end is not None:
+                stop = bisect.bisect_left(_AbsTimes(levents), end, position)
+
+            for event in levents[position:stop]:
+                if end is not None and type(event) is events.EndOfTrackEvent:
+                    continue
+
+                event = copy.copy(event)
+                event.abs_delta_time -= start
+                tracks[track].append(event)
+
+                if type(event) is events.NoteOnEvent and event.velocity:
+                    held[(event.channel, event.note)] = track
+                elif type(event) in (events.NoteOnEvent, events.NoteOffEvent):
+                    held.pop((event.channel, event.note), None)
+
+        if end is not None:
+            closing = [(track, events.NoteOffEvent(0, [note, 0], channel - 1))
+                       for (channel, note), track in held.items()]
+            closing += [(track, events.EndOfTrackEvent(0)) for track in range(len(tracks))]
+
+            for track, event in closing:
+                event.abs_delta_time = end - start
+                tracks[track].append(event)
+
+        sliced = []
+        for levents in tracks:
+            last_time = 0
+            for event in levents:
+                event.delta_time = event.abs_delta_time - last_time
+                last_time = event.abs_delta_time
+
+            chunk = MTrk(_chunk_header(0))
+            chunk.events = levents
+            sliced.append(chunk)
+
+        return sliced
+
+    @property
+    def note_index(self):
+        if self._note_index is None:
+            self._note_index = NoteIndex(self)
+
+        return self._note_index
+
+    def compile(self, start=0, channel_events=False):
+        return CompiledPlayback.from_midi_file(self, start, channel_events)
+
+    def play(self, controller, start=0, stats=None, compiled=False):
         self.reset()
+        Player(self, controller, start, stats, compiled).play()
 
-        if self.header.format_type == 1:
-            threads = []
+    def play_async(self, controller, *, start=0, loop=False, stats=None):
+        # Awaiting the returned player plays the file, keep a reference to
+        # pause or resume it from another task
+        return AsyncPlayer(self, controller, start, loop, stats)
 
-            for chunk in self.chunks:
-                thread = threading.Thread(
-                    target=self._play, args=[chunk, controller])
-                thread.daemon = True
-                threads.append(thread)
+    def save(self, file, running_status=True):
+        writer.write(self, file, running_status)
 
-            for thread in threads:
-                thread.start()
+    def apply_filter(self, event_filter):
+        # Decoded tracks are filtered in place, the rest when first decoded
+        for chunk in self.chunks:
+            if chunk.is_loaded:
+                chunk.events = event_filter.apply(chunk.events)
+            else:
+                chunk.event_filter = event_filter
 
-            for thread in threads:
-                thread.join()
+        # The tempo map is kept, it may have seen tempo changes filtered out
+        self.event_filter = event_filter
+        self._seek_index = None
+        self._note_index = None
 
     def reset(self):
         for chunk in self.chunks:
             chunk.last_index = -1
             chunk.last_read_event = None
+            chunk._group = 0
 
-    def _busy_wait(self, t):
 
-        if t < 0.01:
-            target = time.time() + t
-            while time.time() < target:
-                pass
-        else:
-            time.sleep(t)
+def _index_chunks(header, data):
+    chunks = []
+    offset = 8 + header.chunk_size
+
+    while len(chunks) < header.track_count and offset + 8 <= len(data):
+        size = int.from_bytes(data[offset+4:offset+8], "big")
+        if offset + 8 + size > len(data):
+            raise InvalidMidiFile("Truncated chunk at byte {}".format(offset))
+
+        # Unknown chunk types are skipped as the spec requires
+        if data[offset:offset+4] == b'MTrk':
+            chunks.append((offset, size))
 
+        offset += 8 + size
 
-def load(file_name):
-    return MidiFile(file_name)
+    return chunks
+
+
+def _chunk_header(size):
+    return b'MTrk' + size.to_bytes(4, "big")
+
+
+def _decode_chunk(file_name, offset, size, event_filter=None):
+    from midistuff.midi_parser.table import EventTable
+
+    with open(file_name, "rb") as file:
+        file.seek(offset)
+        return EventTable.from_bytes(file.read(size), event_filter)
+
+
+def _merge_events(iterators):
+    return heapq.merge(*iterators, key=operator.attrgetter("abs_delta_time"))
+
+
+def _read_exact(file, size, allow_eof=False):
+    data = file.read(size)
+
+    # Pipes and sockets may return short reads
+    while len(data) < size:
+        if allow_eof and not data:
+            return data
+
+        more = file.read(size - len(data))
+        if not more:
+            raise InvalidMidiFile("Unexpected end of file")
+
+        data += more
+
+    return data
+
+
+def _iter_stream_events(file, track, merged, event_filter):
+    header = MThd(_read_exact(file, 14))
+    _read_exact(file, header.chunk_size - 6)
+
+    merged = merged and track is None and header.format_type == 1
+    chunks = []
+    chunk_index = 0
+
+    while chunk_index < header.track_count:
+        header_data = _read_exact(file, 8, allow_eof=True)
+        if not header_data:
+            break
+
+        body = _read_exact(file, int.from_bytes(header_data[4:8], "big"))
+        if header_data[:4] != b'MTrk':
+            continue
+
+        chunk = MTrk(header_data, body, event_filter)
+        if merged:
+            # Merging needs every track, so only their bytes are kept
+            chunks.append(chunk)
+        elif track is None or track == chunk_index:
+            yield from chunk.iter_events()
+
+            if track == chunk_index:
+                return
+
+        chunk_index += 1
+
+    if chunks:
+        yield from _merge_events([chunk.iter_events() for chunk in chunks])
+
+
+def iter_events(file, track=None, merged=True, event_filter=None):
+    if hasattr(file, "read"):
+        yield from _iter_stream_events(file, track, merged, event_filter)
+    else:
+        with open(file, "rb") as f:
+            yield from _iter_stream_events(f, track, merged, event_filter)
+
+
+def load(file_name, use_mmap=False, lazy=False, workers=None, cache=None, tail=False,
+         event_filter=None):
+    if cache is not None:
+        # Snapshots are always read through a mapping, and hold every track
+        # decoded, so there is nothing for lazy or tail loading to do
+        if lazy or tail:
+            raise ValueError("cache can't be combined with lazy or tail loading")
+
+        midi_file = cache.load(file_name, workers=workers)
+        if event_filter is not None:
+            midi_file.apply_filter(event_filter)
+
+        return midi_file
+
+    return MidiFile(file_name, use_mmap=use_mmap, lazy=lazy, workers=workers, tail=tail,
+                    event_filter=event_filter)
+
+
+def scan(file_name):
+    # Summary of a file from one walk over its bytes. Only the meta events
+    # reported are built, note ons are counted straight from the bytes.
+    with open(file_name, "rb") as file:
+        data = memoryview(file.read())
+
+    header = MThd(data[:14])
+    get_event = events.get_event
+    note_counts = collections.Counter()
+    tracks = []
+    tempos = []
+    time_signatures = []
+    key_signatures = []
+    copyright_notice = None
+    track_changes = []
+
+    for offset, size in _index_chunks(header, data):
+        track = {"name": None, "instruments": [], "ticks": 0}
+        changes = []
+
+        for abs_time, delta_time, status, data1, data2, payload in iter_raw_events(
+                data[offset+8:offset+8+size], event_filter=_SCAN_FILTER):
+            track["ticks"] = abs_time
+
+            if status != 0xFF:
+                if data2:
+                    note_counts[(status & 0x0F) + 1] += 1
+                continue
+
+            event = get_event(delta_time, 255, payload, data1)
+            if type(event) is events.TrackNameEvent:
+                if track["name"] is None:
+                    track["name"] = event.name
+            elif type(event) is events.InstrumentNameEvent:
+                track["instruments"].append(event.name)
+            elif type(event) is events.CopyrightNoticeEvent:
+                if copyright_notice is None:
+                    copyright_notice = event.notice
+            elif type(event) is events.SetTempoEvent:
+                changes.append((abs_time, event.tempo))
+            elif type(event) is events.TimeSignatureEvent:
+                time_signatures.append((abs_time, event.numerator, event.denominator))
+            elif type(event) is events.KeySignatureEvent:
+                key_signatures.append((abs_time, event.key, event.scale))
+
+        tracks.append(track)
+        tempos.extend(changes)
+        track_changes.append(changes)
+
+    # Ticks are on the file's timeline, as in MidiFile.sequence_offsets
+    offsets = [0] * len(tracks)
+    if header.format_type == 2:
+        for index in range(1, len(tracks)):
+            offsets[index] = offsets[index - 1] + tracks[index - 1]["ticks"]
+
+    tempo_map = TempoMap.from_tracks(
+        header.time_division, zip(offsets, track_changes), header.format_type == 2)
+    ticks = max((offset + track["ticks"] for offset, track in zip(offsets, tracks)), default=0)
+    seconds = tempo_map.tick_to_seconds(ticks)
+
+    return {
+        "format": header.format_type,
+        "track_count": header.track_count,
+        "time_division": header.time_division,
+        "tracks": tracks,
+        "copyright": copyright_notice,
+        "ticks": ticks,
+        "seconds": seconds,
+        "tempos": sorted(tempos),
+        "time_signatures": sorted(time_signatures),
+        "key_signatures": sorted(key_signatures),
+        "note_counts": dict(sorted(note_counts.items()))
+    }
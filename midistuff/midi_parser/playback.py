@@ -0,0 +1,444 @@
+import midistuff.midi_parser.events as events
+from midistuff.midi_parser.tempo import TempoMap
+import collections
+import itertools
+import threading
+import asyncio
+import operator
+import heapq
+import array
+import math
+import time
+
+
+# Waits sleep until this close to a deadline, then spin for the rest
+SPIN_THRESHOLD = 0.002
+
+# Controller 123, all notes off, sent on every channel
+ALL_NOTES_OFF = [[0xB0 | channel, 123, 0] for channel in range(16)]
+
+
+def wait_until(deadline, stopped=None, stats=None):
+    remaining = deadline - time.perf_counter()
+
+    if remaining > SPIN_THRESHOLD:
+        if stats is not None:
+            stats.sleeps += 1
+
+        if stopped is None:
+            time.sleep(remaining - SPIN_THRESHOLD)
+        elif stopped.wait(remaining - SPIN_THRESHOLD):
+            return False
+    elif stopped is not None and stopped.is_set():
+        return False
+
+    if stats is not None and time.perf_counter() < deadline:
+        stats.spins += 1
+
+    while time.perf_counter() < deadline:
+        pass
+
+    return True
+
+
+class PlaybackStats:
+    # Opt-in record of how far each group was sent from its deadline,
+    # callback is called as callback(scheduled, sent, event_count)
+    def __init__(self, late_threshold=0.001, callback=None):
+        self.late_threshold = late_threshold
+        self.callback = callback
+
+        self.scheduled = array.array("d")
+        self.sent = array.array("d")
+        self.event_counts = array.array("I")
+
+        self.sleeps = 0
+        self.spins = 0
+        self.late_groups = 0
+        self.late_events = 0
+        self.max_threads = 0
+
+    def __repr__(self):
+        return "PlaybackStats(groups={}, p50={:.6f}, p99={:.6f}, max={:.6f})".format(
+            len(self), self.p50, self.p99, self.max_lateness)
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    def record(self, scheduled, sent, group):
+        self.scheduled.append(scheduled)
+        self.sent.append(sent)
+        self.event_counts.append(len(group))
+
+        if sent - scheduled > self.late_threshold:
+            self.late_groups += 1
+            self.late_events += len(group)
+
+        self.max_threads = max(self.max_threads, threading.active_count())
+
+        if self.callback is not None:
+            self.callback(scheduled, sent, len(group))
+
+    @property
+    def lateness(self):
+        return array.array("d", map(operator.sub, self.sent, self.scheduled))
+
+    def percentile(self, percent):
+        # Nearest rank, so the result is always a measured value
+        lateness = sorted(self.lateness)
+        if not lateness:
+            return 0.0
+
+        rank = max(math.ceil(percent / 100 * len(lateness)), 1)
+        return lateness[rank - 1]
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    @property
+    def max_lateness(self):
+        return max(self.lateness, default=0.0)
+
+    def histogram(self, bucket=0.0001):
+        # (bucket start, group count) pairs for every non-empty bucket
+        counts = collections.Counter(
+            math.floor(lateness / bucket) for lateness in self.lateness)
+
+        return [(index * bucket, counts[index]) for index in sorted(counts)]
+
+    def summary(self):
+        return {
+            "groups": len(self),
+            "events": sum(self.event_counts),
+            "p50": self.p50,
+            "p99": self.p99,
+            "max": self.max_lateness,
+            "sleeps": self.sleeps,
+            "spins": self.spins,
+            "late_groups": self.late_groups,
+            "late_events": self.late_events,
+            "max_threads": self.max_threads
+        }
+
+
+def _iter_tick_groups(levents, tempo_map):
+    for tick, group in itertools.groupby(levents, operator.attrgetter("abs_delta_time")):
+        yield tempo_map.tick_to_seconds(tick), list(group)
+
+
+def iter_groups(midi_file, positions=None):
+    # Yields (seconds, events) for every tick that has events, in order,
+    # optionally starting each track from the given event index
+    if midi_file.header.format_type == 2:
+        # Independent sequences with their own tempo, played back to back
+        offset = 0.0
+
+        for track, chunk in enumerate(midi_file.chunks):
+            tempo_map = TempoMap.from_events(
+                midi_file.header.time_division, chunk.iter_meta_events())
+
+            seconds = 0.0
+            if positions is None:
+                levents = chunk.iter_events()
+            else:
+                # Sequences a seek skipped over still take up their time
+                levents = chunk.events[positions[track]:]
+                if chunk.events:
+                    seconds = tempo_map.tick_to_seconds(chunk.events[-1].abs_delta_time)
+
+            for seconds, group in _iter_tick_groups(levents, tempo_map):
+                yield offset + seconds, group
+
+            offset += seconds
+    else:
+        if positions is None:
+            tracks = [chunk.iter_events() for chunk in midi_file.chunks]
+        else:
+            tracks = [map(chunk.events.__getitem__, range(position, len(chunk.events)))
+                      for chunk, position in zip(midi_file.chunks, positions)]
+
+        merged = heapq.merge(*tracks, key=operator.attrgetter("abs_delta_time"))
+
+        yield from _iter_tick_groups(merged, midi_file.tempo_map)
+
+
+def _chase(midi_file, controller, start):
+    # Sends programs, controllers and held notes up to start, returns the
+    # track positions to play from
+    if not start:
+        return None
+
+    positions, state = midi_file.seek(seconds=start)
+    for message in state.messages():
+        controller.send_raw_message(message)
+
+    return positions
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _encode_event(event, channel_events):
+    if event.is_meta:
+        return None
+
+    status = event.event << 4 | event.channel - 1
+
+    if type(event) is events.NoteOnEvent:
+        return bytes((status, event.note, event.velocity))
+    elif type(event) is events.NoteOffEvent:
+        # Sent the way _play_events does, as a note on with velocity 0
+        if not channel_events:
+            return bytes((status | 0x10, event.note, 0))
+
+        return bytes((status, event.note, event.release_velocity))
+    elif channel_events:
+        return bytes((status,) + event.params()[:event.param_count])
+
+    return None
+
+
+class CompiledPlayback:
+    # Messages pre-encoded back to back in data, sorted by deadline. The
+    # playback loop only slices data and hands the bytes over.
+    def __init__(self):
+        self.deadline_ns = array.array("Q")
+        self.offsets = array.array("I")
+        self.lengths = array.array("B")
+        self.data = b''
+
+        # Time of the file's last event, meta events included
+        self.end_ns = 0
+
+    def __repr__(self):
+        return "CompiledPlayback(message_count={}, nbytes={})".format(
+            len(self), len(self.data))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def nbytes(self):
+        return len(self.data) + sum(column.itemsize * len(column) for column in (
+            self.deadline_ns, self.offsets, self.lengths))
+
+    @classmethod
+    def from_midi_file(cls, midi_file, start=0, channel_events=False):
+        compiled = cls()
+        data = bytearray()
+        positions = None
+
+        def add(seconds, message):
+            compiled.deadline_ns.append(round((seconds - start) * 1e9))
+            compiled.offsets.append(len(data))
+            compiled.lengths.append(len(message))
+            data.extend(message)
+
+        if start:
+            # The chased state is sent straight away
+            positions, state = midi_file.seek(seconds=start)
+            for message in state.messages():
+                add(start, message)
+
+        seconds = start
+        for seconds, group in iter_groups(midi_file, positions):
+            for event in group:
+                message = _encode_event(event, channel_events)
+                if message is not None:
+                    add(seconds, message)
+
+        compiled.data = bytes(data)
+        compiled.end_ns = round(max(seconds - start, 0) * 1e9)
+
+        return compiled
+
+    def play(self, controller, stopped=None, stats=None, start=None):
+        # Returns False if stopped before the end. start is the
+        # perf_counter() time of deadline 0, defaulting to now.
+        send = controller.send_raw_message
+        deadline_ns = self.deadline_ns
+        offsets = self.offsets
+        lengths = self.lengths
+        data = self.data
+        count = len(self)
+        index = 0
+
+        if start is None:
+            start = time.perf_counter()
+
+        while index < count:
+            group_ns = deadline_ns[index]
+            deadline = start + group_ns * 1e-9
+            if not wait_until(deadline, stopped, stats):
+                return False
+
+            sent = time.perf_counter()
+            first = index
+            while index < count and deadline_ns[index] == group_ns:
+                offset = offsets[index]
+                send(data[offset:offset + lengths[index]])
+                index += 1
+
+            if stats is not None:
+                stats.record(deadline, sent, range(first, index))
+
+        return True
+
+
+class Player:
+    def __init__(self, midi_file, controller, start=0, stats=None, compiled=False):
+        self.midi_file = midi_file
+        self.controller = controller
+        self.start_time = start
+        self.stats = stats
+        self.compiled = compiled
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "Player(file={}, playing={})".format(
+            self.midi_file.file, self.is_playing)
+
+    @property
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def play(self):
+        self._stopped.clear()
+
+        if self.compiled:
+            # All the per event work happens before the first deadline
+            compiled = self.midi_file.compile(self.start_time)
+            compiled.play(self.controller, self._stopped, self.stats)
+            return
+
+        dispatch = self.midi_file._play_events
+        stats = self.stats
+        positions = _chase(self.midi_file, self.controller, self.start_time)
+
+        # Deadlines are absolute, late groups never push back later ones
+        start = time.perf_counter() - self.start_time
+        for seconds, group in iter_groups(self.midi_file, positions):
+            if not wait_until(start + seconds, self._stopped, stats):
+                break
+
+            if stats is not None:
+                stats.record(start + seconds, time.perf_counter(), group)
+
+            dispatch(group, self.controller)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.play)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class AsyncPlayer:
+    # Runs on the event loop's timers, so any number of players can share
+    # one loop without threads. Awaiting the player plays it, pause() and
+    # resume() may be called from other tasks meanwhile.
+    def __init__(self, midi_file, controller, start=0, loop=False, stats=None):
+        self.midi_file = midi_file
+        self.controller = controller
+        self.start_time = start
+        self.loop = loop
+        self.stats = stats
+
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._waiter = None
+
+    def __repr__(self):
+        return "AsyncPlayer(file={}, paused={})".format(
+            self.midi_file.file, self.is_paused)
+
+    def __await__(self):
+        return self.play().__await__()
+
+    @property
+    def is_paused(self):
+        return not self._resumed.is_set()
+
+    def pause(self):
+        self._resumed.clear()
+
+        # Wake the player so it silences the output straight away
+        if self._waiter is not None:
+            _resolve(self._waiter)
+
+    def resume(self):
+        self._resumed.set()
+
+    def silence(self):
+        for message in ALL_NOTES_OFF:
+            self.controller.send_raw_message(message)
+
+    async def _wait_until(self, deadline):
+        event_loop = asyncio.get_running_loop()
+        self._waiter = event_loop.create_future()
+        handle = event_loop.call_at(deadline, _resolve, self._waiter)
+
+        try:
+            await self._waiter
+        finally:
+            handle.cancel()
+            self._waiter = None
+
+    async def play(self):
+        event_loop = asyncio.get_running_loop()
+        dispatch = self.midi_file._play_events
+        positions = _chase(self.midi_file, self.controller, self.start_time)
+
+        # Deadlines are absolute, pauses move the start forward by their
+        # length and each pass of a loop starts where the last one ended
+        start = event_loop.time() - self.start_time
+
+        try:
+            while True:
+                seconds = 0.0
+
+                for seconds, group in iter_groups(self.midi_file, positions):
+                    while self.is_paused or event_loop.time() < start + seconds:
+                        if self.is_paused:
+                            paused_at = event_loop.time()
+                            self.silence()
+                            await self._resumed.wait()
+                            start += event_loop.time() - paused_at
+                        else:
+                            if self.stats is not None:
+                                self.stats.sleeps += 1
+
+                            await self._wait_until(start + seconds)
+
+                    if self.stats is not None:
+                        self.stats.record(start + seconds, event_loop.time(), group)
+
+                    dispatch(group, self.controller)
+
+                if not self.loop:
+                    break
+
+                # Looping a pass with no length would never yield to the loop
+                if seconds <= 0:
+                    raise ValueError("Cannot loop a file with no length")
+
+                start += seconds
+                positions = None
+        except asyncio.CancelledError:
+            self.silence()
+            raise
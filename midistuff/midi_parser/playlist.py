@@ -0,0 +1,195 @@
+import midistuff.midi_parser.parser as parser
+import concurrent.futures
+import collections
+import threading
+import logging
+import time
+
+
+# A file ready later than this past its deadline starts when it's ready
+LATE_START = 0.001
+
+
+def _compile_file(load, path):
+    return load(path).compile()
+
+
+class Playlist:
+    # Plays queued files back to back. The next few files are parsed and
+    # compiled while the current one plays, and each file starts at the
+    # deadline the previous one ended on. Parsing runs in a worker process
+    # so it never holds the GIL the playback loop is waiting on, compiled
+    # files are plain arrays and cheap to send back.
+    def __init__(self, controller, paths=(), preload=2, max_bytes=64 * 2**20,
+                 stats=None, load=parser.load):
+        self.controller = controller
+        self.preload = preload
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.load = load
+
+        self.queue = collections.deque(paths)
+        self.current = None
+
+        # Compiled files (or the error loading them) by path. Paths evicted
+        # for memory are not loaded again until the queue moves on.
+        self._compiled = {}
+        self._evicted = set()
+
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._loader = None
+        self._executor = None
+
+    def __repr__(self):
+        return "Playlist(current={}, queued={}, preloaded={})".format(
+            self.current, len(self.queue), len(self._compiled))
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def nbytes(self):
+        return sum(compiled.nbytes for compiled in self._compiled.values()
+                   if not isinstance(compiled, Exception))
+
+    def add(self, path):
+        with self._condition:
+            self.queue.append(path)
+            self._condition.notify_all()
+
+    def extend(self, paths):
+        with self._condition:
+            self.queue.extend(paths)
+            self._condition.notify_all()
+
+    def _upcoming(self):
+        upcoming = [] if self.current is None else [self.current]
+        upcoming += list(self.queue)[:self.preload]
+
+        return upcoming
+
+    def _next_to_load(self):
+        upcoming = self._upcoming()
+
+        for index, path in enumerate(upcoming):
+            if path in self._compiled or path in self._evicted:
+                continue
+
+            # The file needed next is always loaded, the rest only fit the budget
+            if index == 0 or self.nbytes < self.max_bytes:
+                return path
+
+            break
+
+        return None
+
+    def _evict(self):
+        # Files needed last go first, the next file to play is always kept
+        upcoming = self._upcoming()
+
+        for path in list(self._compiled):
+            if path not in upcoming:
+                del self._compiled[path]
+
+        for path in reversed(upcoming[1:]):
+            if self.nbytes <= self.max_bytes:
+                break
+
+            if self._compiled.pop(path, None) is not None:
+                self._evicted.add(path)
+
+    def _run_loader(self):
+        while True:
+            # The stop flag is only read under the lock, so a stop can't
+            # slip in between the check and the wait
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopped.is_set() or self._next_to_load() is not None)
+                if self._stopped.is_set():
+                    return
+
+                path = self._next_to_load()
+
+            try:
+                compiled = self._executor.submit(_compile_file, self.load, path).result()
+            except Exception as error:
+                logging.error("FAILED TO LOAD {}: {}".format(path, error))
+                compiled = error
+
+            with self._condition:
+                self._compiled[path] = compiled
+                self._evict()
+                self._condition.notify_all()
+
+    def _next(self):
+        # Blocks until the next file is compiled, None once the queue is empty
+        with self._condition:
+            if not self.queue:
+                self.current = None
+                return None
+
+            self.current = self.queue.popleft()
+            self._evicted.clear()
+            self._condition.notify_all()
+
+            while self.current not in self._compiled and not self._stopped.is_set():
+                self._condition.wait()
+
+            return self._compiled.get(self.current)
+
+    def play(self):
+        self._stopped.clear()
+        self._executor = concurrent.futures.ProcessPoolExecutor(1)
+        self._loader = threading.Thread(target=self._run_loader)
+        self._loader.daemon = True
+        self._loader.start()
+
+        start = None
+        try:
+            while not self._stopped.is_set():
+                compiled = self._next()
+                if compiled is None:
+                    break
+                if isinstance(compiled, Exception):
+                    continue
+
+                # A file that wasn't ready in time starts late rather than
+                # rushing through the deadlines it missed
+                now = time.perf_counter()
+                if start is None or start < now - LATE_START:
+                    start = now
+
+                if not compiled.play(self.controller, self._stopped, self.stats, start):
+                    break
+
+                start += compiled.end_ns * 1e-9
+        finally:
+            with self._condition:
+                self._stopped.set()
+                self.current = None
+                self._condition.notify_all()
+
+            self._loader.join()
+            self._loader = None
+            self._executor.shutdown()
+            self._executor = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.play)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
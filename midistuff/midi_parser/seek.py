@@ -0,0 +1,207 @@
+import midistuff.midi_parser.events as events
+from midistuff.midi_parser.tempo import DEFAULT_TEMPO
+import bisect
+import array
+import heapq
+
+
+class ChannelState:
+    def __init__(self):
+        self.tempo = DEFAULT_TEMPO
+        self.programs = {}
+        self.controllers = {}
+        self.pitch_bends = {}
+        self.held_notes = {}
+
+    def __repr__(self):
+        return "ChannelState(tempo={}, programs={}, controllers={}, held_notes={})".format(
+            self.tempo, len(self.programs), len(self.controllers), len(self.held_notes))
+
+    def __len__(self):
+        return (len(self.programs) + len(self.controllers)
+                + len(self.pitch_bends) + len(self.held_notes))
+
+    def copy(self):
+        state = ChannelState()
+        state.tempo = self.tempo
+        state.programs = self.programs.copy()
+        state.controllers = self.controllers.copy()
+        state.pitch_bends = self.pitch_bends.copy()
+        state.held_notes = self.held_notes.copy()
+
+        return state
+
+    def apply(self, event):
+        handler = _HANDLERS.get(type(event))
+        if handler is not None:
+            handler(self, event)
+
+    def _note_on(self, event):
+        if event.velocity:
+            self.held_notes[(event.channel, event.note)] = event.velocity
+        else:
+            self.held_notes.pop((event.channel, event.note), None)
+
+    def _note_off(self, event):
+        self.held_notes.pop((event.channel, event.note), None)
+
+    def _controller(self, event):
+        self.controllers[(event.channel, event.controller_type)] = event.value
+
+    def _program_change(self, event):
+        self.programs[event.channel] = event.program_number
+
+    def _pitch_bend(self, event):
+        self.pitch_bends[event.channel] = (event.value_lsb, event.value_msb)
+
+    def _set_tempo(self, event):
+        self.tempo = event.tempo
+
+    def pack(self):
+        # Three bytes per entry, far smaller than a copy of the dicts
+        data = bytearray()
+        for channel, program in self.programs.items():
+            data += bytes((0xBF + channel, program, 0))
+        for (channel, controller), value in self.controllers.items():
+            data += bytes((0xAF + channel, controller, value))
+        for channel, (lsb, msb) in self.pitch_bends.items():
+            data += bytes((0xDF + channel, lsb, msb))
+        for (channel, note), velocity in self.held_notes.items():
+            data += bytes((0x8F + channel, note, velocity))
+
+        return bytes(data)
+
+    @classmethod
+    def unpack(cls, data, tempo):
+        state = cls()
+        state.tempo = tempo
+
+        for index in range(0, len(data), 3):
+            status, data1, data2 = data[index:index+3]
+            channel = (status & 0x0F) + 1
+
+            if status >> 4 == 0xC:
+                state.programs[channel] = data1
+            elif status >> 4 == 0xB:
+                state.controllers[(channel, data1)] = data2
+            elif status >> 4 == 0xE:
+                state.pitch_bends[channel] = (data1, data2)
+            else:
+                state.held_notes[(channel, data1)] = data2
+
+        return state
+
+    def messages(self, notes=True):
+        # Raw MIDI messages that bring an output device into this state
+        messages = [[0xC0 | channel - 1, program]
+                    for channel, program in sorted(self.programs.items())]
+        messages += [[0xB0 | channel - 1, controller, value]
+                     for (channel, controller), value in sorted(self.controllers.items())]
+        messages += [[0xE0 | channel - 1, lsb, msb]
+                     for channel, (lsb, msb) in sorted(self.pitch_bends.items())]
+
+        if notes:
+            messages += [[0x90 | channel - 1, note, velocity]
+                         for (channel, note), velocity in sorted(self.held_notes.items())]
+
+        return messages
+
+
+_HANDLERS = {
+    events.NoteOnEvent: ChannelState._note_on,
+    events.NoteOffEvent: ChannelState._note_off,
+    events.ControllerEvent: ChannelState._controller,
+    events.ProgramChangeEvent: ChannelState._program_change,
+    events.PitchBendEvent: ChannelState._pitch_bend,
+    events.SetTempoEvent: ChannelState._set_tempo
+}
+
+
+def _iter_track(levents, track, position, offset):
+    for index in range(position, len(levents)):
+        yield offset + levents[index].abs_delta_time, track, index
+
+
+class SeekIndex:
+    def __init__(self, midi_file, interval=128):
+        self.midi_file = midi_file
+        self.interval = interval
+
+        # Ticks are on the file's timeline, so in a format 2 file a tick
+        # falls in one sequence and every earlier sequence has played out
+        self.offsets = midi_file.sequence_offsets()
+        self.sequential = midi_file.header.format_type == 2
+
+        # Checkpoint i holds the state after every event before ticks[i],
+        # and for each track the index of its first event at or after it
+        self.ticks = array.array("Q")
+        self.positions = [array.array("I") for chunk in midi_file.chunks]
+        self.tempos = array.array("d")
+        self.states = []
+
+        self._build()
+
+    def __repr__(self):
+        return "SeekIndex(checkpoint_count={}, interval={})".format(
+            len(self.ticks), self.interval)
+
+    def _iter_merged(self, positions):
+        # (tick, track, index) for every event from the given positions on
+        return heapq.merge(*[
+            _iter_track(chunk.events, track, position, offset)
+            for track, (chunk, position, offset) in enumerate(
+                zip(self.midi_file.chunks, positions, self.offsets))])
+
+    def _apply(self, state, event, index):
+        # Each format 2 sequence starts over at the default tempo
+        if self.sequential and index == 0:
+            state.tempo = DEFAULT_TEMPO
+
+        state.apply(event)
+
+    def _build(self):
+        tracks = [chunk.events for chunk in self.midi_file.chunks]
+        positions = [0] * len(tracks)
+        state = ChannelState()
+        since_checkpoint = self.interval
+        last_tick = None
+
+        for tick, track, index in self._iter_merged(positions):
+            # Checkpoints only fall between ticks, never inside a group.
+            # Big states are checkpointed less often so packing them stays
+            # a small cost per event.
+            if since_checkpoint >= max(self.interval, len(state) // 4) and tick != last_tick:
+                self._add_checkpoint(tick, positions, state)
+                since_checkpoint = 0
+
+            self._apply(state, tracks[track][index], index)
+            positions[track] = index + 1
+            since_checkpoint += 1
+            last_tick = tick
+
+        if not self.states:
+            self._add_checkpoint(0, positions, state)
+
+    def _add_checkpoint(self, tick, positions, state):
+        self.ticks.append(tick)
+        for track_positions, position in zip(self.positions, positions):
+            track_positions.append(position)
+        self.tempos.append(state.tempo)
+        self.states.append(state.pack())
+
+    def seek(self, tick):
+        # Returns the state before tick, and each track's first event index
+        # at or after it
+        checkpoint = max(bisect.bisect_right(self.ticks, tick) - 1, 0)
+        positions = [track_positions[checkpoint] for track_positions in self.positions]
+        state = ChannelState.unpack(self.states[checkpoint], self.tempos[checkpoint])
+        tracks = [chunk.events for chunk in self.midi_file.chunks]
+
+        for event_tick, track, index in self._iter_merged(list(positions)):
+            if event_tick >= tick:
+                break
+
+            self._apply(state, tracks[track][index], index)
+            positions[track] = index + 1
+
+        return positions, state
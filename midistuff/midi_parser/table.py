@@ -0,0 +1,209 @@
+import midistuff.midi_parser.events as events
+import midistuff.midi_parser.parser as parser
+import bisect
+import array
+import heapq
+import copy
+
+
+class EventTable:
+    column_names = (
+        "abs_time", "delta_time", "status", "channel", "data1", "data2")
+
+    def __init__(self):
+        self.abs_time = array.array("Q")
+        self.delta_time = array.array("I")
+        self.status = array.array("B")
+        self.channel = array.array("B")
+        self.data1 = array.array("B")
+        self.data2 = array.array("B")
+
+        # Meta events stay objects, each stored with the row it precedes
+        self.meta_rows = array.array("I")
+        self.meta_events = []
+
+    def __repr__(self):
+        return "EventTable(event_count={}, meta_count={})".format(
+            len(self), len(self.meta_events))
+
+    def __len__(self):
+        return len(self.status)
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column)
+                   for column in self.columns() + [self.meta_rows])
+
+    def columns(self):
+        return [getattr(self, name) for name in self.column_names]
+
+    def append(self, abs_time, delta_time, status, channel, data1, data2):
+        self.abs_time.append(abs_time)
+        self.delta_time.append(delta_time)
+        self.status.append(status)
+        self.channel.append(channel)
+        self.data1.append(data1)
+        self.data2.append(data2)
+
+    def append_meta(self, event):
+        self.meta_rows.append(len(self.status))
+        self.meta_events.append(event)
+
+    @classmethod
+    def from_events(cls, levents):
+        table = cls()
+        rows = []
+
+        # Columns are filled in one go, appending row by row costs more
+        # than building the objects did
+        for event in levents:
+            if event.is_meta:
+                table.meta_rows.append(len(rows))
+                table.meta_events.append(event)
+            else:
+                rows.append((event.abs_delta_time, event.delta_time,
+                             event.event, event.channel) + event.params())
+
+        for column, values in zip(table.columns(), zip(*rows)):
+            column.extend(values)
+
+        return table
+
+    @classmethod
+    def from_bytes(cls, data, event_filter=None):
+        table = cls()
+        get_event = events.get_event
+
+        for abs_time, delta_time, status, data1, data2, payload in parser.iter_raw_events(
+                data, event_filter=event_filter):
+            if status == 0xFF:
+                event = get_event(delta_time, 255, payload, data1)
+                if event is not None:
+                    event.abs_delta_time = abs_time
+                    table.append_meta(event)
+            else:
+                table.append(abs_time, delta_time, status >> 4,
+                             (status & 0x0F) + 1, data1, data2)
+
+        return table
+
+    @classmethod
+    def from_track(cls, chunk):
+        # Unloaded lazy tracks are decoded straight into the table, through
+        # the track's filter if it has one
+        if chunk.is_loaded:
+            return cls.from_events(chunk.events)
+
+        source = chunk._read_source()
+        if isinstance(source, cls):
+            if chunk.event_filter is None:
+                return source
+
+            return cls.from_events(source.to_events(chunk.event_filter))
+
+        return cls.from_bytes(source, chunk.event_filter)
+
+    def to_events(self, event_filter=None):
+        if event_filter is not None:
+            return self._to_filtered_events(event_filter)
+
+        get_event = events.get_event
+        meta_rows = self.meta_rows
+        meta_events = self.meta_events
+        meta_index = 0
+        levents = []
+
+        rows = zip(self.abs_time, self.delta_time, self.status,
+                   self.channel, self.data1, self.data2)
+        for row, (abs_time, delta_time, status, channel, data1, data2) in enumerate(rows):
+            while meta_index < len(meta_rows) and meta_rows[meta_index] == row:
+                levents.append(meta_events[meta_index])
+                meta_index += 1
+
+            event = get_event(delta_time, status, [data1, data2],
+                              channel=channel - 1)
+            event.abs_delta_time = abs_time
+            levents.append(event)
+
+        levents.extend(meta_events[meta_index:])
+
+        return levents
+
+    def _to_filtered_events(self, event_filter):
+        # Rows are checked against the filter before any object is built,
+        # delta times are rebased onto the events kept
+        statuses = event_filter.statuses
+        get_event = events.get_event
+
+        # Meta events are shared with the table, so copies are retimed
+        meta_events = [(row, -1, copy.copy(event))
+                       for row, event in zip(self.meta_rows, self.meta_events)
+                       if event_filter.matches(event)]
+
+        low = bisect.bisect_left(self.abs_time, event_filter.start)
+        high = len(self) if event_filter.end is None else bisect.bisect_left(
+            self.abs_time, event_filter.end)
+
+        channel_events = []
+        for row in range(low, high):
+            status, channel = self.status[row], self.channel[row]
+            if statuses[(status << 4) | (channel - 1)]:
+                event = get_event(0, status, [self.data1[row], self.data2[row]],
+                                  channel=channel - 1)
+                event.abs_delta_time = self.abs_time[row]
+                channel_events.append((row, row, event))
+
+        # Meta events sort before the row they precede
+        levents = []
+        last_time = 0
+        for row, order, event in heapq.merge(meta_events, channel_events,
+                                             key=lambda item: item[:2]):
+            event.delta_time = event.abs_delta_time - last_time
+            last_time = event.abs_delta_time
+            levents.append(event)
+
+        return levents
+
+    def select(self, status=None, channel=None, start=None, end=None):
+        if isinstance(status, type):
+            status = status.event
+
+        # Rows are in tick order, so the tick range is two bisections
+        low = 0 if start is None else bisect.bisect_left(self.abs_time, start)
+        high = len(self) if end is None else bisect.bisect_left(self.abs_time, end)
+        rows = range(low, high)
+
+        if status is not None and channel is not None:
+            rows = (row for row, s, c in zip(rows, self.status[low:high], self.channel[low:high])
+                    if s == status and c == channel)
+        elif status is not None:
+            rows = (row for row, s in zip(rows, self.status[low:high])
+                    if s == status)
+        elif channel is not None:
+            rows = (row for row, c in zip(rows, self.channel[low:high])
+                    if c == channel)
+
+        return array.array("I", rows)
+
+    def to_numpy(self):
+        import numpy
+
+        # Cached tables hold read-only memoryviews instead of arrays
+        return {name: numpy.frombuffer(column, dtype=memoryview(column).format)
+                for name, column in zip(self.column_names, self.columns())}
+
+    @classmethod
+    def from_numpy(cls, columns, meta_rows=(), meta_events=()):
+        table = cls()
+
+        for name, column in zip(cls.column_names, table.columns()):
+            column.frombytes(columns[name].astype(column.typecode).tobytes())
+
+        table.meta_rows.extend(meta_rows)
+        table.meta_events.extend(meta_events)
+
+        return table
+
+
+def from_file(midi_file):
+    return [EventTable.from_track(chunk) for chunk in midi_file.chunks]
@@ -0,0 +1,123 @@
+import midistuff.midi_parser.events as events
+import bisect
+import array
+
+
+# Tempo assumed until the first SetTempoEvent, in beats per minute
+DEFAULT_TEMPO = 120
+
+
+class TempoMap:
+    def __init__(self, time_division, changes=()):
+        self.time_division = time_division
+
+        # One segment per tempo change: start tick, seconds elapsed at
+        # that tick and seconds per tick until the next change
+        self.ticks = array.array("Q")
+        self.seconds = array.array("d")
+        self.scales = array.array("d")
+        self.tempos = array.array("d")
+
+        if time_division & 0x8000:
+            # SMPTE division, ticks have a fixed length and tempo is ignored
+            fps = 256 - (time_division >> 8)
+            if fps == 29:
+                fps = 29.97
+
+            self._add(0, 0.0, 1 / (fps * (time_division & 0xFF)), DEFAULT_TEMPO)
+            return
+
+        self._add(0, 0.0, self._scale(DEFAULT_TEMPO), DEFAULT_TEMPO)
+        for tick, tempo in sorted(changes, key=lambda change: change[0]):
+            start = self.ticks[-1]
+            if tick == start:
+                # Later changes on the same tick win
+                self.scales[-1] = self._scale(tempo)
+                self.tempos[-1] = tempo
+            else:
+                seconds = self.seconds[-1] + (tick - start) * self.scales[-1]
+                self._add(tick, seconds, self._scale(tempo), tempo)
+
+    def __repr__(self):
+        return "TempoMap(time_division={}, change_count={})".format(
+            self.time_division, len(self.ticks))
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def _scale(self, tempo):
+        return 60 / (tempo * self.time_division)
+
+    def _add(self, tick, seconds, scale, tempo):
+        self.ticks.append(tick)
+        self.seconds.append(seconds)
+        self.scales.append(scale)
+        self.tempos.append(tempo)
+
+    @classmethod
+    def from_events(cls, time_division, levents):
+        return cls(time_division, [
+            (event.abs_delta_time, event.tempo) for event in levents
+            if type(event) is events.SetTempoEvent])
+
+    @classmethod
+    def from_tracks(cls, time_division, tracks, sequential=False):
+        # tracks holds each track's start tick and its (tick, tempo)
+        # changes on its own ticks. Sequential tracks, the sequences of a
+        # format 2 file, each start over at the default tempo.
+        changes = []
+        for offset, track_changes in tracks:
+            if sequential:
+                changes.append((offset, DEFAULT_TEMPO))
+
+            changes += [(offset + tick, tempo) for tick, tempo in track_changes]
+
+        return cls(time_division, changes)
+
+    @classmethod
+    def from_midi_file(cls, midi_file):
+        tracks = [
+            (offset, [(event.abs_delta_time, event.tempo)
+                      for event in chunk.iter_meta_events()
+                      if type(event) is events.SetTempoEvent])
+            for chunk, offset in zip(midi_file.chunks, midi_file.sequence_offsets())]
+
+        return cls.from_tracks(
+            midi_file.header.time_division, tracks, midi_file.header.format_type == 2)
+
+    def tempo_at(self, tick):
+        return self.tempos[bisect.bisect_right(self.ticks, tick) - 1]
+
+    def tick_to_seconds(self, tick):
+        index = bisect.bisect_right(self.ticks, tick) - 1
+        return self.seconds[index] + (tick - self.ticks[index]) * self.scales[index]
+
+    def seconds_to_tick(self, seconds):
+        index = max(bisect.bisect_right(self.seconds, seconds) - 1, 0)
+        return self.ticks[index] + (seconds - self.seconds[index]) / self.scales[index]
+
+    def ticks_to_seconds(self, ticks):
+        return array.array("d", self._convert(
+            ticks, self.ticks, self.seconds, self.tick_to_seconds))
+
+    def seconds_to_ticks(self, seconds):
+        return array.array("d", self._convert(
+            seconds, self.seconds, self.ticks, self.seconds_to_tick))
+
+    def _convert(self, values, starts, targets, convert):
+        # Sorted input, like a track's abs times, stays in the current
+        # segment and only bisects when it crosses into another one
+        index = 0
+        low = starts[0]
+        high = starts[1] if len(starts) > 1 else None
+
+        for value in values:
+            if value < low or (high is not None and value >= high):
+                index = max(bisect.bisect_right(starts, value) - 1, 0)
+                low = starts[index]
+                high = starts[index + 1] if index + 1 < len(starts) else None
+
+            if starts is self.ticks:
+                yield targets[index] + (value - low) * self.scales[index]
+            else:
+                yield targets[index] + (value - low) / self.scales[index]
@@ -0,0 +1,217 @@
+import midistuff.midi_parser.events as events
+import midistuff.midi_parser.parser as parser
+from midistuff.midi_parser.table import EventTable
+import collections
+import copy
+
+import numpy
+
+
+# Status nibbles whose first data byte is a note number
+_NOTE_STATUSES = (events.NoteOffEvent.event, events.NoteOnEvent.event,
+                  events.NoteAftertouchEvent.event)
+
+
+class _Batch:
+    # One track as int64 columns, so steps can do arithmetic without
+    # overflowing, plus its meta events and the rows they precede
+    def __init__(self, table):
+        self.columns = {name: column.astype(numpy.int64)
+                        for name, column in table.to_numpy().items()}
+        self.meta_events = list(table.meta_events)
+        self.meta_rows = numpy.array(table.meta_rows, dtype=numpy.int64)
+        self.meta_times = numpy.array(
+            [event.abs_delta_time for event in self.meta_events], dtype=numpy.int64)
+
+    def keep(self, mask):
+        # Meta events stay before the first kept row they preceded
+        kept_before = numpy.concatenate(([0], numpy.cumsum(mask)))
+        self.meta_rows = kept_before[self.meta_rows]
+
+        for name, column in self.columns.items():
+            self.columns[name] = column[mask]
+
+    def keep_meta(self, mask):
+        self.meta_events = [event for event, kept in zip(self.meta_events, mask) if kept]
+        self.meta_rows = self.meta_rows[mask]
+        self.meta_times = self.meta_times[mask]
+
+    def channel_mask(self, channels):
+        if channels is None:
+            return numpy.ones(len(self.columns["channel"]), dtype=bool)
+
+        return numpy.isin(self.columns["channel"], list(channels))
+
+    def to_table(self):
+        # Steps may have moved events past each other, so the track is put
+        # back in tick order with meta events before the row they preceded.
+        # Delta times are then rebuilt over the merged order.
+        columns = self.columns
+        row_count = len(columns["abs_time"])
+        meta_count = len(self.meta_events)
+
+        # Steps may have moved channel events past the end of the track, so
+        # EndOfTrack moves to the last tick, after every row
+        ends = numpy.array([type(event) is events.EndOfTrackEvent
+                            for event in self.meta_events], dtype=bool)
+        if ends.any():
+            last_tick = max(self.meta_times.max(), columns["abs_time"].max(initial=0))
+            self.meta_times[ends] = last_tick
+            self.meta_rows[ends] = row_count
+
+        times = numpy.concatenate((self.meta_times, columns["abs_time"]))
+        sequence = numpy.concatenate((self.meta_rows * 2, numpy.arange(row_count) * 2 + 1))
+        order = numpy.lexsort((sequence, times))
+
+        is_row = order >= meta_count
+        delta_times = numpy.diff(times[order], prepend=0)
+
+        rows = order[is_row] - meta_count
+        for name, column in columns.items():
+            columns[name] = column[rows]
+        columns["delta_time"] = delta_times[is_row]
+
+        # Meta events are shared with the source track, so copies are retimed
+        meta_rows = numpy.cumsum(is_row)[~is_row]
+        meta_events = []
+        for index, abs_time, delta_time in zip(
+                order[~is_row], times[order][~is_row], delta_times[~is_row]):
+            event = copy.copy(self.meta_events[index])
+            event.abs_delta_time = int(abs_time)
+            event.delta_time = int(delta_time)
+            meta_events.append(event)
+
+        return EventTable.from_numpy(columns, meta_rows.tolist(), meta_events)
+
+
+def _transpose(batch, semitones, channels):
+    columns = batch.columns
+    selected = numpy.isin(columns["status"], _NOTE_STATUSES) & batch.channel_mask(channels)
+    notes = columns["data1"] + semitones
+
+    # Notes pushed out of range are dropped along with their note off
+    columns["data1"] = numpy.where(selected, notes, columns["data1"])
+    batch.keep(~selected | ((notes >= 0) & (notes <= 127)))
+
+
+def _scale_velocity(batch, factor, offset, low, high, channels):
+    columns = batch.columns
+
+    # Velocity 0 note ons are note offs and stay that way
+    selected = ((columns["status"] == events.NoteOnEvent.event) & (columns["data2"] > 0)
+                & batch.channel_mask(channels))
+    velocities = numpy.clip(numpy.rint(columns["data2"] * factor + offset), low, high)
+    columns["data2"] = numpy.where(selected, velocities, columns["data2"]).astype(numpy.int64)
+
+
+def _stretch(batch, factor):
+    columns = batch.columns
+    columns["abs_time"] = numpy.rint(columns["abs_time"] * factor).astype(numpy.int64)
+    batch.meta_times = numpy.rint(batch.meta_times * factor).astype(numpy.int64)
+
+
+def _pair_notes(batch, selected):
+    # Rows of each note on and the note off releasing it, paired like the
+    # note index: repeated notes on a key are released first in, first out
+    # and note offs with nothing held are left unpaired
+    columns = batch.columns
+    status, velocity = columns["status"], columns["data2"]
+    note_on = status == events.NoteOnEvent.event
+    is_on = selected & note_on & (velocity > 0)
+    is_off = selected & ((status == events.NoteOffEvent.event) | (note_on & (velocity == 0)))
+
+    rows = numpy.flatnonzero(is_on | is_off)
+    keys = columns["channel"][rows] * 128 + columns["data1"][rows]
+    held = collections.defaultdict(collections.deque)
+    on_rows = []
+    off_rows = []
+
+    for row, key, on in zip(rows.tolist(), keys.tolist(), is_on[rows].tolist()):
+        if on:
+            held[key].append(row)
+        elif held[key]:
+            on_rows.append(held[key].popleft())
+            off_rows.append(row)
+
+    return (numpy.array(on_rows, dtype=numpy.int64),
+            numpy.array(off_rows, dtype=numpy.int64))
+
+
+def _quantise(batch, grid, channels):
+    # Note ons and the other channel events snap to the grid, note offs
+    # move with their note on so every note keeps its length
+    columns = batch.columns
+    selected = batch.channel_mask(channels)
+    times = columns["abs_time"]
+    snapped = numpy.where(selected, (times + grid // 2) // grid * grid, times)
+
+    on_rows, off_rows = _pair_notes(batch, selected)
+    snapped[off_rows] = times[off_rows] + snapped[on_rows] - times[on_rows]
+
+    columns["abs_time"] = snapped
+
+
+def _remap_channels(batch, mapping):
+    lookup = numpy.arange(17)
+    for source, target in mapping.items():
+        lookup[source] = target
+
+    batch.columns["channel"] = lookup[batch.columns["channel"]]
+
+
+def _drop(batch, kinds):
+    statuses = [cls.event for cls in events.MIDI_EVENTS.values() if issubclass(cls, kinds)]
+    batch.keep(~numpy.isin(batch.columns["status"], statuses))
+    batch.keep_meta([not isinstance(event, kinds) for event in batch.meta_events])
+
+
+class Pipeline:
+    def __init__(self):
+        # Each step works on a whole track of columns at once
+        self.steps = []
+
+    def __repr__(self):
+        return "Pipeline(steps=[{}])".format(
+            ", ".join(func.__name__.lstrip("_") for func, args in self.steps))
+
+    def _add(self, func, *args):
+        self.steps.append((func, args))
+        return self
+
+    def transpose(self, semitones, channels=None):
+        return self._add(_transpose, semitones, channels)
+
+    def scale_velocity(self, factor=1.0, offset=0, low=1, high=127, channels=None):
+        return self._add(_scale_velocity, factor, offset, low, high, channels)
+
+    def stretch(self, factor):
+        return self._add(_stretch, factor)
+
+    def quantise(self, grid, channels=None):
+        # Snaps every channel event but note offs, which keep the length of
+        # their note. Meta events keep their ticks, EndOfTrack stays last.
+        return self._add(_quantise, grid, channels)
+
+    def remap_channels(self, mapping):
+        return self._add(_remap_channels, mapping)
+
+    def drop(self, *kinds):
+        return self._add(_drop, kinds)
+
+    def apply_table(self, table):
+        batch = _Batch(table)
+        for func, args in self.steps:
+            func(batch, *args)
+
+        return batch.to_table()
+
+    def apply(self, midi_file):
+        # Tracks are replaced by tables and only become objects when used
+        midi_file.chunks = [
+            parser.MTrk(parser._chunk_header(chunk.chunk_size),
+                        self.apply_table(EventTable.from_track(chunk)))
+            for chunk in midi_file.chunks]
+        midi_file.reset()
+        midi_file._invalidate()
+
+        return midi_file
@@ -0,0 +1,113 @@
+import midistuff.midi_parser.events as events
+
+
+def encode_var_len(value):
+    if value < 0x80:
+        return bytes((value,))
+
+    data = bytearray((value & 0x7F,))
+    value >>= 7
+
+    while value:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    data.reverse()
+
+    return bytes(data)
+
+
+# Most delta times fit in one or two bytes
+_VAR_LEN = [encode_var_len(value) for value in range(0x4000)]
+
+
+def encode_track(levents, running_status=True):
+    # Delta times are taken from abs_delta_time, so merged or filtered
+    # event streams encode correctly, and events must be in tick order.
+    # Events built by hand only have delta times: an event still at tick 0
+    # with a delta time past it switches the track to its delta times.
+    data = bytearray()
+    var_len = _VAR_LEN
+    end_of_track = events.EndOfTrackEvent
+    status = None
+    by_delta = False
+    last_time = 0
+    end_time = 0
+
+    for event in levents:
+        if not by_delta and not last_time and not event.abs_delta_time and event.delta_time:
+            by_delta = True
+
+        abs_time = last_time + event.delta_time if by_delta else event.abs_delta_time
+
+        # A merged stream may hold several, only one closes the track
+        if type(event) is end_of_track:
+            end_time = max(end_time, abs_time)
+            continue
+
+        delta_time = abs_time - last_time
+        if delta_time < 0:
+            raise ValueError("Event at tick {} comes after tick {}".format(abs_time, last_time))
+
+        last_time = abs_time
+
+        if delta_time < 0x4000:
+            data += var_len[delta_time]
+        else:
+            data += encode_var_len(delta_time)
+
+        if event.is_meta:
+            payload = event._data
+            data.append(0xFF)
+            data.append(event.meta_type)
+            data += encode_var_len(len(payload))
+            data += payload
+
+            # Meta events cancel running status for strict readers
+            status = None
+            continue
+
+        event_status = (event.event << 4) | (event.channel - 1)
+        if event_status != status or not running_status:
+            data.append(event_status)
+            status = event_status
+
+        data1, data2 = event.params()
+        data.append(data1)
+        if event.param_count == 2:
+            data.append(data2)
+
+    data += encode_var_len(max(end_time - last_time, 0))
+    data += b'\xff\x2f\x00'
+
+    return bytes(data)
+
+
+def encode_header(format_type, track_count, time_division):
+    return b''.join([
+        b'MThd', (6).to_bytes(4, "big"), format_type.to_bytes(2, "big"),
+        track_count.to_bytes(2, "big"), time_division.to_bytes(2, "big")])
+
+
+def write_track(file, levents, running_status=True):
+    body = encode_track(levents, running_status)
+    file.write(b'MTrk' + len(body).to_bytes(4, "big") + body)
+
+
+def write_events(file, tracks, format_type=1, time_division=480, running_status=True):
+    # tracks is a list of event iterables, each encoded as it is consumed
+    if not hasattr(file, "write"):
+        with open(file, "wb") as f:
+            return write_events(f, tracks, format_type, time_division, running_status)
+
+    file.write(encode_header(format_type, len(tracks), time_division))
+
+    for levents in tracks:
+        write_track(file, levents, running_status)
+
+
+def write(midi_file, file, running_status=True):
+    write_events(
+        file, [chunk.iter_events() for chunk in midi_file.chunks],
+        midi_file.header.format_type, midi_file.header.time_division,
+        running_status)
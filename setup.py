@@ -24,7 +24,8 @@ setup(
     version=version,
     packages=[
         "midistuff",
-        "midistuff.launchpad"
+        "midistuff.launchpad",
+        "midistuff.midi_parser"
     ],
     #license="MIT",
     description="A Python wrapper for the VRChat WebAPI supporting both sync and async",
@@ -32,6 +33,9 @@ setup(
     long_description_content_type="text/markdown",
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        "transform": ["numpy"]
+    },
     python_requires=">=3.5.3",
     classifiers=[
         "Intended Audience :: Developers",
@@ -0,0 +1,13 @@
+def fields(event):
+    # Events are slotted, so their state is every slot up the hierarchy
+    names = [name for cls in type(event).__mro__
+             for name in getattr(cls, "__slots__", ())]
+    values = {name: getattr(event, name, None) for name in names}
+    if "_data" in values:
+        values["_data"] = bytes(values["_data"])
+
+    return type(event).__name__, values
+
+
+def track_fields(levents):
+    return [fields(event) for event in levents]
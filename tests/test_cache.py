@@ -0,0 +1,112 @@
+import midistuff.midi_parser.parser as parser
+from midistuff.midi_parser.cache import ParseCache
+from midistuff.midi_parser.table import EventTable
+import midistuff.midi_parser.events as events
+from helpers import track_fields
+import synthetic
+
+import pytest
+import os
+
+
+@pytest.fixture
+def file_name(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(4, 500, meta_density=0.05))
+
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ParseCache(str(tmp_path / "cache"))
+
+
+def _warm(file_name, cache):
+    # The first load writes the snapshot, the second reads it back
+    parser.load(file_name, cache=cache)
+    return parser.load(file_name, cache=cache)
+
+
+def test_cached_events_match(file_name, cache):
+    expected = parser.load(file_name)
+    midi_file = _warm(file_name, cache)
+
+    for chunk, expected_chunk in zip(midi_file.chunks, expected.chunks):
+        assert track_fields(chunk.events) == track_fields(expected_chunk.events)
+
+
+def test_cached_table_consumers(file_name, cache):
+    expected = EventTable.from_track(parser.load(file_name).chunks[1])
+    table = EventTable.from_track(_warm(file_name, cache).chunks[1])
+
+    for name, column in table.to_numpy().items():
+        assert column.tolist() == list(getattr(expected, name))
+
+    assert list(table.select(events.NoteOnEvent)) == \
+        list(expected.select(events.NoteOnEvent))
+    assert track_fields(table.to_events()) == track_fields(expected.to_events())
+
+
+def test_cached_pipeline(file_name, cache):
+    transform = pytest.importorskip("midistuff.midi_parser.transform")
+
+    expected = transform.Pipeline().transpose(2).apply(parser.load(file_name))
+    midi_file = transform.Pipeline().transpose(2).apply(_warm(file_name, cache))
+
+    for chunk, expected_chunk in zip(midi_file.chunks, expected.chunks):
+        assert track_fields(chunk.events) == track_fields(expected_chunk.events)
+
+
+def test_concurrent_writers(file_name, cache):
+    # Writers racing on one entry each replace it with a whole snapshot
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: parser.load(file_name, cache=cache), range(8)))
+
+    assert [entry.name for entry in os.scandir(cache.directory)] == \
+        [os.path.basename(cache.path(cache.key(file_name)))]
+    assert track_fields(_warm(file_name, cache).chunks[1].events) == \
+        track_fields(parser.load(file_name).chunks[1].events)
+
+
+def test_evict_tolerates_removed_entries(file_name, cache):
+    parser.load(file_name, cache=cache)
+    entries = cache.entries()
+    cache.clear()
+
+    cache.entries = lambda: entries
+    cache.max_size = 0
+    cache.evict()
+    cache.clear()
+
+
+@pytest.mark.parametrize("size", [0, 10, 100, -9, -1])
+def test_damaged_entries_are_parsed_again(file_name, cache, size):
+    parser.load(file_name, cache=cache)
+    path = cache.path(cache.key(file_name))
+
+    with open(path, "rb") as file:
+        data = file.read()
+    with open(path, "wb") as file:
+        file.write(data[:size])
+
+    assert cache.read(path) is None
+    assert track_fields(parser.load(file_name, cache=cache).chunks[1].events) == \
+        track_fields(parser.load(file_name).chunks[1].events)
+    assert cache.read(path) is not None
+
+
+@pytest.mark.parametrize("option", ["lazy", "tail"])
+def test_cache_refuses_lazy_and_tail(file_name, cache, option):
+    with pytest.raises(ValueError):
+        parser.load(file_name, cache=cache, **{option: True})
+
+
+def test_stale_version_is_parsed_again(file_name, cache, monkeypatch):
+    monkeypatch.setattr(parser, "PARSER_VERSION", parser.PARSER_VERSION - 1)
+    parser.load(file_name, cache=cache)
+    monkeypatch.undo()
+
+    assert cache.read(cache.path(cache.key(file_name))) is None
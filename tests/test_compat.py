@@ -0,0 +1,166 @@
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.writer as writer
+from midistuff.midi_parser.table import EventTable
+from midistuff.midi_parser.filters import EventFilter
+import midistuff.midi_parser.events as events
+from helpers import fields, track_fields
+import baseline_parser
+import synthetic
+
+import pytest
+
+
+# The reference decoder copies the previous event's delta time and
+# channel for running status events, those are checked separately
+CORPUS = {
+    "plain": dict(running_status=False),
+    "running_status": dict(running_status=True),
+    "meta": dict(running_status=False, meta_density=0.1),
+    "meta_running_status": dict(running_status=True, meta_density=0.1),
+    "sysex": dict(running_status=False, sysex_density=0.1),
+    "sysex_meta_running_status": dict(running_status=True, meta_density=0.1, sysex_density=0.1),
+}
+
+
+# Events the parser steps over, each put before every note of a track so
+# their delta times have to carry over to the note
+SKIPPED = {
+    "unknown_meta": b'\xff\x60\x02\x01\x02',
+    "sysex_delta": b'\xf0\x03\x7e\x09\xf7',
+}
+
+
+def _skipped_events_file(skipped):
+    body = bytearray()
+    for index in range(50):
+        body += b'\x10' + skipped
+        body += b'\x20\x90' + bytes((60 + index % 12, 100))
+    body += b'\x00\xff\x2f\x00'
+
+    return (b'MThd' + (6).to_bytes(4, "big") + (0).to_bytes(2, "big")
+            + (1).to_bytes(2, "big") + (480).to_bytes(2, "big")
+            + b'MTrk' + len(body).to_bytes(4, "big") + bytes(body))
+
+
+@pytest.fixture(params=list(CORPUS) + list(SKIPPED))
+def corpus_file(request, tmp_path):
+    if request.param in SKIPPED:
+        data = _skipped_events_file(SKIPPED[request.param])
+        options = dict(sysex_density=request.param == "sysex_delta")
+    else:
+        data = synthetic.generate(3, 400, seed=7, **CORPUS[request.param])
+        options = CORPUS[request.param]
+
+    path = tmp_path / (request.param + ".mid")
+    path.write_bytes(data)
+
+    return str(path), options
+
+
+def _decoders(file_name):
+    yield "load", parser.load(file_name).chunks
+    yield "mmap", parser.load(file_name, use_mmap=True).chunks
+    yield "lazy", [list(chunk.iter_events()) for chunk in parser.load(file_name, lazy=True).chunks]
+    yield "table", [EventTable.from_track(chunk).to_events()
+                    for chunk in parser.load(file_name, lazy=True).chunks]
+
+
+def _track_events(chunk):
+    return chunk if isinstance(chunk, list) else chunk.events
+
+
+def _reference(file_name, options):
+    # The reference decoder can't step over sysex, so it reads the file
+    # written back out without them
+    if options.get("sysex_density"):
+        stripped = file_name + ".stripped"
+        writer.write(parser.load(file_name), stripped, running_status=False)
+        file_name = stripped
+
+    return baseline_parser.MidiFile(file_name).chunks
+
+
+def _key(event, running_status):
+    name, values = fields(event)
+    del values["delta_time"]
+    if running_status:
+        del values["channel"]
+
+    return name, values
+
+
+def test_matches_reference(corpus_file):
+    file_name, options = corpus_file
+    running_status = options.get("running_status", False)
+    reference = [[_key(event, running_status) for event in chunk.events]
+                 for chunk in _reference(file_name, options)]
+
+    for name, chunks in _decoders(file_name):
+        decoded = [[_key(event, running_status) for event in _track_events(chunk)]
+                   for chunk in chunks]
+        assert decoded == reference, name
+
+
+def test_delta_times_follow_abs_times(corpus_file):
+    file_name, options = corpus_file
+
+    for name, chunks in _decoders(file_name):
+        for chunk in chunks:
+            last_time = 0
+            for event in _track_events(chunk):
+                assert event.delta_time == event.abs_delta_time - last_time, name
+                last_time = event.abs_delta_time
+
+
+def test_feed_matches_load(corpus_file):
+    file_name, options = corpus_file
+    expected = parser.load(file_name)
+
+    with open(file_name, "rb") as file:
+        data = file.read()
+
+    for expected_chunk, (offset, size) in zip(
+            expected.chunks, parser._index_chunks(expected.header, memoryview(data))):
+        chunk = parser.MTrk(data[offset:offset+8])
+        body = data[offset+8:offset+8+size]
+        for index in range(0, len(body), 7):
+            chunk.feed(body[index:index+7])
+
+        assert [fields(event) for event in chunk.events] == \
+            [fields(event) for event in expected_chunk.events]
+
+
+def test_filtered_walk_resumes_from_state(corpus_file):
+    file_name, options = corpus_file
+    event_filter = EventFilter((events.NoteOnEvent, events.MetaEvent), start=100)
+
+    with open(file_name, "rb") as file:
+        data = file.read()
+    header = parser.MThd(data[:14])
+
+    for offset, size in parser._index_chunks(header, memoryview(data)):
+        body = data[offset+8:offset+8+size]
+        expected = list(parser.iter_raw_events(body, event_filter=event_filter))
+
+        # Fed a few bytes at a time, truncated events are read again
+        state = [0, None, 0, 0]
+        decoded = []
+        for stop in range(7, len(body) + 7, 7):
+            try:
+                for raw_event in parser.iter_raw_events(body[:stop], state, event_filter):
+                    decoded.append(raw_event[:5] + (bytes(raw_event[5] or b''),))
+            except IndexError:
+                pass
+
+        assert decoded == [raw_event[:5] + (bytes(raw_event[5] or b''),) for raw_event in expected]
+
+
+def test_tail_load_keeps_filter(corpus_file):
+    file_name, options = corpus_file
+    event_filter = EventFilter((events.NoteOnEvent, events.TextEvent), channels={1, 2})
+
+    expected = parser.load(file_name, event_filter=event_filter)
+    midi_file = parser.load(file_name, tail=True, event_filter=event_filter)
+
+    assert [track_fields(chunk.events) for chunk in midi_file.chunks] == \
+        [track_fields(chunk.events) for chunk in expected.chunks]
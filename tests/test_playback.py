@@ -0,0 +1,135 @@
+import midistuff.midi_parser.playback as playback
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.writer as writer
+import midistuff.midi_parser.events as events
+
+import asyncio
+import pytest
+
+
+ALL_NOTES_OFF = [("raw", bytes(message)) for message in playback.ALL_NOTES_OFF]
+
+
+class Controller:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, note, velocity, channel):
+        self.messages.append(("note", note, velocity, channel))
+
+    def send_raw_message(self, message):
+        self.messages.append(("raw", bytes(message)))
+
+    def notes(self):
+        return [message[1:3] for message in self.messages if message[0] == "note"]
+
+
+def _event(event, tick):
+    event.abs_delta_time = tick
+    return event
+
+
+def _write(path, notes):
+    # 1200 bpm, so each beat lasts 50ms
+    levents = [_event(events.SetTempoEvent(0, (50000).to_bytes(3, "big")), 0)]
+    for beat, note in enumerate(notes):
+        levents.append(_event(events.NoteOnEvent(0, [note, 100], 0), beat * 480))
+        levents.append(_event(events.NoteOffEvent(0, [note, 0], 0), beat * 480 + 240))
+
+    levents.append(_event(events.EndOfTrackEvent(0), len(notes) * 480))
+    writer.write_events(str(path), [levents])
+
+    return parser.load(str(path))
+
+
+@pytest.fixture
+def midi_file(tmp_path):
+    return _write(tmp_path / "short.mid", [60, 62, 64])
+
+
+PASS = [(60, 100), (60, 0), (62, 100), (62, 0), (64, 100), (64, 0)]
+
+
+async def _until(condition, timeout=5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.001)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_plays_every_note(midi_file):
+    controller = Controller()
+    asyncio.run(midi_file.play_async(controller).play())
+
+    assert controller.notes() == PASS
+
+
+def test_pause_silences_and_resume_continues(midi_file):
+    controller = Controller()
+
+    async def run():
+        player = midi_file.play_async(controller)
+        task = asyncio.ensure_future(player.play())
+
+        await _until(lambda: controller.notes())
+        player.pause()
+        await _until(lambda: controller.messages[-1] == ALL_NOTES_OFF[-1])
+        paused = list(controller.messages)
+
+        # Nothing is sent while paused, even past the end of the file
+        await asyncio.sleep(0.3)
+        assert controller.messages == paused
+        assert player.is_paused
+
+        player.resume()
+        await asyncio.wait_for(task, 5)
+
+        return paused
+
+    paused = asyncio.run(run())
+
+    assert paused[-len(ALL_NOTES_OFF):] == ALL_NOTES_OFF
+    assert controller.notes() == PASS
+
+
+def test_cancel_silences(midi_file):
+    controller = Controller()
+
+    async def run():
+        task = asyncio.ensure_future(midi_file.play_async(controller).play())
+
+        await _until(lambda: controller.notes())
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert controller.messages[-len(ALL_NOTES_OFF):] == ALL_NOTES_OFF
+    assert len(controller.notes()) < len(PASS)
+
+
+def test_loop_repeats(midi_file):
+    controller = Controller()
+
+    async def run():
+        task = asyncio.ensure_future(midi_file.play_async(controller, loop=True).play())
+
+        await _until(lambda: len(controller.notes()) >= 2 * len(PASS) + 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    notes = controller.notes()
+    assert notes[:2 * len(PASS)] == PASS + PASS
+    assert notes[2 * len(PASS)] == PASS[0]
+
+
+def test_loop_without_length_fails(tmp_path):
+    midi_file = _write(tmp_path / "empty.mid", [])
+
+    with pytest.raises(ValueError):
+        asyncio.run(midi_file.play_async(Controller(), loop=True).play())
@@ -0,0 +1,55 @@
+from midistuff.midi_parser.playlist import Playlist
+import synthetic
+
+import threading
+
+
+class Controller:
+    def __init__(self):
+        self.messages = []
+
+    def send_raw_message(self, message):
+        self.messages.append(bytes(message))
+
+
+def _play(playlist, timeout=30):
+    # Runs play() on a thread so a hang fails the test instead of the run
+    thread = threading.Thread(target=playlist.play)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+
+    return not thread.is_alive()
+
+
+def test_empty_queue_finishes():
+    assert _play(Playlist(Controller()))
+
+
+def test_failing_file_finishes(tmp_path):
+    playlist = Playlist(Controller(), [str(tmp_path / "missing.mid")])
+
+    assert _play(playlist)
+    assert playlist.current is None
+
+
+def test_failing_files_are_skipped(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(1, 8, density=64.0))
+    controller = Controller()
+
+    playlist = Playlist(controller, [str(tmp_path / "missing.mid"), str(path)])
+
+    assert _play(playlist)
+    assert controller.messages
+
+
+def test_stop_while_playing(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(1, 2000))
+
+    playlist = Playlist(Controller(), [str(path)] * 3)
+    playlist.start()
+    playlist.stop()
+
+    assert not playlist.is_playing
@@ -0,0 +1,51 @@
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.enums as enums
+import synthetic
+
+
+def _track(body):
+    body += b'\x00\xff\x2f\x00'
+    return b'MTrk' + len(body).to_bytes(4, "big") + body
+
+
+def test_scan_decodes_names_and_keys(tmp_path):
+    path = tmp_path / "meta.mid"
+    path.write_bytes(
+        b'MThd' + (6).to_bytes(4, "big") + (1).to_bytes(2, "big")
+        + (1).to_bytes(2, "big") + synthetic.TIME_DIVISION.to_bytes(2, "big")
+        + _track(b'\x00\xff\x03\x04Caf\xe9'
+                 + b'\x00\xff\x04\x05Pi\xe0no'
+                 + b'\x00\xff\x59\x02\xfd\x01'))
+
+    summary = parser.scan(str(path))
+    assert summary["tracks"][0]["name"] == "Café"
+    assert summary["tracks"][0]["instruments"] == ["Piàno"]
+    assert summary["key_signatures"] == [(0, -3, 1)]
+
+    midi_file = parser.load(str(path))
+    assert midi_file.key_sig == (-3, 1)
+    assert enums.KeySignatureKey(midi_file.key_sig[0]) is enums.KeySignatureKey.EF
+
+
+def test_file_meta_on_every_load(tmp_path):
+    path = tmp_path / "meta.mid"
+    header = (b'MThd' + (6).to_bytes(4, "big") + (1).to_bytes(2, "big")
+              + (1).to_bytes(2, "big") + synthetic.TIME_DIVISION.to_bytes(2, "big"))
+    track = _track(b'\x00\xff\x02\x06(c) me'
+                   + b'\x00\xff\x58\x04\x03\x02\x18\x08'
+                   + b'\x00\xff\x59\x02\x02\x00')
+    path.write_bytes(header + track)
+
+    for options in ({}, {"lazy": True}, {"use_mmap": True, "lazy": True}, {"tail": True}):
+        midi_file = parser.load(str(path), **options)
+        assert (midi_file.time_sig, midi_file.key_sig, midi_file.copyright_notice) == \
+            ((3, 4), (2, 0), "(c) me"), options
+
+    # Tail mode picks up meta events written after the first read
+    path.write_bytes(header)
+    midi_file = parser.load(str(path), tail=True)
+    assert midi_file.time_sig is None
+
+    path.write_bytes(header + track)
+    midi_file.update()
+    assert midi_file.time_sig == (3, 4)
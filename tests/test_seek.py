@@ -0,0 +1,91 @@
+import midistuff.midi_parser.__main__ as main
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.writer as writer
+import midistuff.midi_parser.events as events
+
+import pytest
+
+
+def _event(event, tick):
+    event.abs_delta_time = tick
+    return event
+
+
+def _sequence(tempo, program, notes):
+    # One format 2 sequence: its tempo, a program change, then a note
+    # every beat
+    levents = [_event(events.SetTempoEvent(0, round(60000000 / tempo).to_bytes(3, "big")), 0),
+               _event(events.ProgramChangeEvent(0, [program], 0), 0)]
+    for beat, note in enumerate(notes):
+        levents.append(_event(events.NoteOnEvent(0, [note, 100], 0), beat * 480))
+        levents.append(_event(events.NoteOffEvent(0, [note, 0], 0), beat * 480 + 240))
+
+    levents.append(_event(events.EndOfTrackEvent(0), len(notes) * 480))
+
+    return levents
+
+
+@pytest.fixture
+def midi_file(tmp_path):
+    path = str(tmp_path / "sequences.mid")
+    writer.write_events(path, [
+        _sequence(120, 1, [60, 62, 64, 65]),
+        _sequence(60, 2, [67, 69]),
+        _sequence(240, 3, [71, 72, 74, 76])], format_type=2)
+
+    return parser.load(path)
+
+
+def _messages(compiled):
+    return [(deadline, compiled.data[offset:offset+length])
+            for deadline, offset, length in zip(
+                compiled.deadline_ns, compiled.offsets, compiled.lengths)]
+
+
+def test_format_2_timeline(midi_file):
+    assert midi_file.sequence_offsets() == [0, 1920, 2880]
+    assert midi_file.tick_to_seconds(1920) == pytest.approx(2.0)
+    assert midi_file.tick_to_seconds(2880) == pytest.approx(4.0)
+    assert midi_file.compile().end_ns == 5 * 10**9
+
+
+def test_format_2_summary_and_scan(midi_file, tmp_path):
+    # Ticks and seconds both cover the whole timeline
+    summary = main.summarise(str(tmp_path / "sequences.mid"))
+    assert summary["ticks"] == 4800
+    assert summary["duration"] == pytest.approx(5.0)
+
+    scanned = parser.scan(str(tmp_path / "sequences.mid"))
+    assert scanned["ticks"] == 4800
+    assert scanned["seconds"] == pytest.approx(5.0)
+
+
+def test_format_2_seek(midi_file):
+    positions, state = midi_file.seek(seconds=3.0)
+    assert positions == [len(midi_file.chunks[0].events), 4, 0]
+    assert state.tempo == pytest.approx(60)
+    assert state.programs == {1: 2}
+
+
+def test_format_2_compile_from_start(midi_file):
+    full = _messages(midi_file.compile())
+    chased = _messages(midi_file.compile(start=3.0))
+
+    expected = [(deadline - 3 * 10**9, message) for deadline, message in full
+                if deadline >= 3 * 10**9]
+    assert chased[-len(expected):] == expected
+    assert chased[0] == (0, bytes([0xC0, 2]))
+
+
+def test_format_2_slice(midi_file):
+    sliced = midi_file.slice(3.0, 4.5, seconds=True)
+
+    assert [len(chunk.events) for chunk in sliced.chunks][0] == 1
+    assert sliced.sequence_offsets() == [0, 0, 480]
+    assert sliced.tick_to_seconds(sliced.sequence_offsets()[2]) == pytest.approx(1.0)
+
+    full = [message for deadline, message in _messages(midi_file.compile())
+            if 3 * 10**9 <= deadline < 4.5 * 10**9]
+    messages = [message for deadline, message in _messages(sliced.compile())
+                if message[0] >> 4 in (0x8, 0x9)]
+    assert messages == [message for message in full if message[0] >> 4 in (0x8, 0x9)]
@@ -0,0 +1,51 @@
+import midistuff.midi_parser.parser as parser
+from midistuff.midi_parser.filters import EventFilter
+from midistuff.midi_parser.table import EventTable
+import midistuff.midi_parser.events as events
+from helpers import track_fields
+import synthetic
+
+
+def test_filtered_events_leave_meta_events(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(2, 300, meta_density=0.1))
+
+    table = EventTable.from_track(parser.load(str(path)).chunks[0])
+    expected = track_fields(table.to_events())
+
+    levents = table.to_events(EventFilter((events.MetaEvent, events.NoteOnEvent), start=100))
+    assert levents and all(event.abs_delta_time >= 100 for event in levents)
+    assert track_fields(table.to_events()) == expected
+
+
+def test_from_track_keeps_track_filter(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(2, 300))
+    event_filter = EventFilter(events.NoteOnEvent, channels={1})
+
+    for midi_file in (parser.load(str(path), lazy=True, event_filter=event_filter),
+                      parser.load(str(path), use_mmap=True, lazy=True, event_filter=event_filter),
+                      parser.load(str(path), workers=2, event_filter=event_filter)):
+        for chunk in midi_file.chunks:
+            expected = track_fields(list(chunk.iter_events()))
+            table = EventTable.from_track(chunk)
+
+            assert len(table) + len(table.meta_events) == len(expected)
+            assert track_fields(table.to_events()) == expected
+
+
+def test_filters_rebase_delta_times_on_every_path(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(2, 300, meta_density=0.1))
+    event_filter = EventFilter((events.NoteOnEvent, events.TextEvent), start=50)
+
+    pushed_down = parser.load(str(path), event_filter=event_filter)
+    expected = [track_fields(chunk.events) for chunk in pushed_down.chunks]
+
+    midi_file = parser.load(str(path))
+    iterated = [track_fields(chunk.iter_events(event_filter)) for chunk in midi_file.chunks]
+    midi_file.apply_filter(event_filter)
+    applied = [track_fields(chunk.events) for chunk in midi_file.chunks]
+
+    assert iterated == expected
+    assert applied == expected
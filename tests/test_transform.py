@@ -0,0 +1,47 @@
+import midistuff.midi_parser.events as events
+from midistuff.midi_parser.table import EventTable
+
+import pytest
+
+transform = pytest.importorskip("midistuff.midi_parser.transform")
+
+
+def _table(levents):
+    for event, tick in levents:
+        event.abs_delta_time = tick
+
+    return EventTable.from_events([event for event, tick in levents])
+
+
+def _ticks(table):
+    return [(type(event).__name__, event.abs_delta_time) for event in table.to_events()]
+
+
+def test_quantise_keeps_note_lengths():
+    table = _table([
+        (events.NoteOnEvent(0, [60, 100], 0), 0),
+        (events.NoteOnEvent(0, [62, 100], 0), 10),
+        (events.NoteOffEvent(0, [60, 0], 0), 100),
+        (events.NoteOnEvent(0, [62, 0], 0), 110),
+        (events.NoteOnEvent(0, [60, 100], 0), 500),
+        (events.NoteOffEvent(0, [60, 0], 0), 530),
+        (events.EndOfTrackEvent(0), 530)])
+
+    quantised = transform.Pipeline().quantise(480).apply_table(table)
+
+    assert _ticks(quantised) == [
+        ("NoteOnEvent", 0), ("NoteOnEvent", 0), ("NoteOffEvent", 100),
+        ("NoteOnEvent", 100), ("NoteOnEvent", 480), ("NoteOffEvent", 510),
+        ("EndOfTrackEvent", 530)]
+
+
+def test_end_of_track_stays_last():
+    table = _table([
+        (events.NoteOnEvent(0, [60, 100], 0), 0),
+        (events.ControllerEvent(0, [7, 100], 0), 300),
+        (events.EndOfTrackEvent(0), 300)])
+
+    assert _ticks(transform.Pipeline().quantise(480).apply_table(table)) == [
+        ("NoteOnEvent", 0), ("ControllerEvent", 480), ("EndOfTrackEvent", 480)]
+    assert _ticks(transform.Pipeline().stretch(2).apply_table(table))[-1] == \
+        ("EndOfTrackEvent", 600)
@@ -0,0 +1,43 @@
+import midistuff.midi_parser.parser as parser
+import midistuff.midi_parser.writer as writer
+import midistuff.midi_parser.events as events
+from helpers import track_fields
+import synthetic
+
+import pytest
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "song.mid"
+    path.write_bytes(synthetic.generate(2, 300, meta_density=0.1))
+    midi_file = parser.load(str(path))
+
+    written = tmp_path / "written.mid"
+    with open(str(written), "wb") as file:
+        writer.write(midi_file, file)
+
+    assert [track_fields(chunk.events) for chunk in parser.load(str(written)).chunks] == \
+        [track_fields(chunk.events) for chunk in midi_file.chunks]
+
+
+def test_events_built_by_delta_time(tmp_path):
+    path = str(tmp_path / "built.mid")
+    writer.write_events(path, [[
+        events.NoteOnEvent(0, [60, 100], 0),
+        events.NoteOffEvent(240, [60, 0], 0),
+        events.NoteOnEvent(240, [62, 100], 0),
+        events.NoteOffEvent(480, [62, 0], 0),
+        events.EndOfTrackEvent(0)]])
+
+    ticks = [event.abs_delta_time for event in parser.load(path).chunks[0].events]
+    assert ticks == [0, 240, 480, 960, 960]
+
+
+def test_out_of_order_events_raise():
+    first = events.NoteOnEvent(0, [60, 100], 0)
+    first.abs_delta_time = 480
+    second = events.NoteOffEvent(0, [60, 0], 0)
+    second.abs_delta_time = 240
+
+    with pytest.raises(ValueError):
+        writer.encode_track([first, second])